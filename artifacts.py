@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Versioned store of trained models with their pre-processing state.
+
+    <root>/<name>/<version>/manifest.json   feature order, pre-processing state, parameters, hashes
+    <root>/<name>/<version>/model.joblib    fitted estimator, uncompressed so its arrays can be memory-mapped
+    <root>/<name>/LATEST                    version loaded by default
+
+The version is a hash of the training data and of the estimator parameters, so
+retraining the same model on the same data gives the same version. A version
+is written once: it is built in a hidden temporary folder that is renamed to
+<version> when complete, and saving a version that already exists leaves its
+files alone, since a scoring process may have model.joblib memory-mapped.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+MANIFEST_FILE = 'manifest.json'
+MODEL_FILE = 'model.joblib'
+LATEST_FILE = 'LATEST'
+RUNTIME_PARAMS = ('n_jobs',)          #how many cores fit or predict, not what is learned
+
+
+def data_hash(*arrays):
+  digest = hashlib.sha256()
+  for values in arrays:
+    values = np.ascontiguousarray(values)
+    digest.update(str((values.dtype, values.shape)).encode())
+    digest.update(values.data)
+  return digest.hexdigest()
+
+
+def params_json(model):
+  """Parameters of the model that define what it learns, RUNTIME_PARAMS left out."""
+  params = dict((k, v) for k, v in model.get_params(deep=False).items() if k not in RUNTIME_PARAMS)
+  return json.dumps(params, sort_keys=True, default=repr)
+
+
+def artifact_version(model, X_train, y_train):
+  """First 12 hex digits of the hash of the training data and the model parameters."""
+  return hashlib.sha256((data_hash(X_train, y_train) + params_json(model)).encode()).hexdigest()[:12]
+
+
+def save_artifact(root, name, model, features, preprocessing, X_train, y_train):
+  """Saves a fitted model with its feature order and pre-processing state, returns its version."""
+  version = artifact_version(model, X_train, y_train)
+  folder = os.path.join(root, name, version)
+  if not os.path.exists(os.path.join(folder, MANIFEST_FILE)):
+    os.makedirs(os.path.join(root, name), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix='.' + version + '-', dir=os.path.join(root, name))       #hidden from list_versions
+    try:
+      joblib.dump(model, os.path.join(tmp, MODEL_FILE))
+      manifest = {'name': name, 'version': version, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'estimator': type(model).__name__, 'params': params_json(model),
+                  'data_hash': data_hash(X_train, y_train), 'rows': len(X_train),
+                  'features': list(features), 'preprocessing': preprocessing}
+      with open(os.path.join(tmp, MANIFEST_FILE), 'w') as f:      #the manifest marks the artifact as complete
+        json.dump(manifest, f, indent=1)
+      if os.path.isdir(folder):
+        shutil.rmtree(folder)                   #left without a manifest by an interrupted save of an older release
+      os.replace(tmp, folder)
+    except OSError:
+      if not os.path.exists(os.path.join(folder, MANIFEST_FILE)):       #else another process saved the same version first
+        raise
+    finally:
+      shutil.rmtree(tmp, ignore_errors=True)
+  latest = os.path.join(root, name, LATEST_FILE)
+  with open(latest + '.tmp', 'w') as f:            #replaced at once, a concurrent load_manifest never reads half a version
+    f.write(version)
+  os.replace(latest + '.tmp', latest)
+  return version
+
+
+def list_versions(root, name):
+  folder = os.path.join(root, name)
+  return sorted(v for v in os.listdir(folder) if not v.startswith('.') and os.path.exists(os.path.join(folder, v, MANIFEST_FILE)))
+
+
+def load_manifest(root, name, version=None):
+  if version is None:
+    with open(os.path.join(root, name, LATEST_FILE)) as f:
+      version = f.read().strip()
+  with open(os.path.join(root, name, version, MANIFEST_FILE)) as f:
+    return json.load(f)
+
+
+def load_artifact(root, name, version=None, mmap=True):
+  """Fitted model and manifest of an artifact, the latest version by default.
+
+  With mmap=True the arrays of the model (tree nodes, training points, weights)
+  are memory-mapped from the file instead of read, which keeps the start of a
+  scoring process fast.
+  """
+  manifest = load_manifest(root, name, version)
+  model = joblib.load(os.path.join(root, name, manifest['version'], MODEL_FILE), mmap_mode='r' if mmap else None)
+  return model, manifest
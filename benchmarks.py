@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the pre-processing stages against the original notebook loops,
+and a load generator for the scoring server.
+
+Run with the path of the Sirio-Libanes sheet:
+    python3 benchmarks.py Kaggle_Sirio_Libanes_ICU_Prediction.xlsx
+or against a running scoring server, with a JSON list of records to send:
+    python3 benchmarks.py --server 127.0.0.1:8000 --records records.json --concurrency 16 --batch 1
+or on synthetic cohorts (synthetic.py) of 1x, 10x and 100x the sheet, against a stored baseline:
+    python3 benchmarks.py --suite --save-baseline
+    python3 benchmarks.py --suite --baseline
+or of the compiled decision tree and random forest against sklearn:
+    python3 benchmarks.py --compiled
+"""
+
+import argparse
+import http.client
+import json
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_loading import load_dataset
+from preprocessing import ID_COLUMN, compact_dtypes, one_hot_encode, propagate_icu_labels, impute_first_window
+
+
+def legacy_impute_first_window(df):
+  """Per patient fillna loop of the original notebook, kept as the reference output."""
+  edited_dfs_list = []
+  max_patient_id = df[ID_COLUMN].max()
+  for i in range(int(max_patient_id)+1):
+    tempdf = df[df[ID_COLUMN]==i]
+    if(len(tempdf)!=0):
+      tempdf = tempdf.fillna(tempdf.mean())
+      tempdf = tempdf.iloc[[0]]
+      edited_dfs_list.append(tempdf)
+  return pd.concat(edited_dfs_list)
+
+
+def best_time(func, *args, repeats=3):
+  """Returns the fastest wall clock time of `repeats` calls and the result of the last call."""
+  best = float('inf')
+  for _ in range(repeats):
+    start = time.perf_counter()
+    result = func(*args)
+    best = min(best, time.perf_counter()-start)
+  return best, result
+
+
+def compare_imputation(df, repeats=3):
+  """Times the original loop against impute_first_window and checks that both give the same frame."""
+  legacy_seconds, expected = best_time(legacy_impute_first_window, df, repeats=repeats)
+  grouped_seconds, result = best_time(impute_first_window, df, repeats=repeats)
+  pd.testing.assert_frame_equal(result.sort_values(ID_COLUMN), expected, check_dtype=False)
+  return {'rows': len(df), 'patients': len(result), 'legacy_seconds': legacy_seconds,
+          'grouped_seconds': grouped_seconds, 'speedup': legacy_seconds/grouped_seconds}
+
+
+def frame_bytes(frame):
+  return int(frame.memory_usage(deep=True).sum())
+
+
+def preprocessing_stages(data, cast):
+  """Runs the pre-processing stages, applying `cast` after each one, and yields (stage, frame)."""
+  frame = cast(data)
+  yield 'load', frame
+  frame = cast(one_hot_encode(frame))
+  yield 'encode', frame
+  frame = cast(propagate_icu_labels(frame))
+  yield 'propagate_labels', frame
+  frame = cast(impute_first_window(frame))
+  yield 'impute', frame
+  frame = cast(frame.dropna(axis = 0))
+  yield 'dropna', frame
+
+
+def as_float64(frame):
+  """Every numeric column as float64, like the homogeneous array of the original notebook."""
+  return frame.astype({c: np.float64 for c in frame.select_dtypes('number').columns})
+
+
+def memory_report(data):
+  """Memory of every pre-processing stage with float64 columns against the compact schema."""
+  wide = dict((stage, frame_bytes(frame)) for stage, frame in preprocessing_stages(data, as_float64))
+  compact = dict((stage, frame_bytes(frame)) for stage, frame in preprocessing_stages(data, compact_dtypes))
+  report = pd.DataFrame({'float64_bytes': wide, 'compact_bytes': compact})
+  report['reduction'] = report['float64_bytes']/report['compact_bytes']
+  return report
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+  def __init__(self, path):
+    http.client.HTTPConnection.__init__(self, 'localhost')
+    self.path = path
+
+  def connect(self):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(self.path)
+
+
+def post_records(connect, records):
+  """Sends one /predict request and returns its latency in seconds."""
+  body = json.dumps({'records': records})
+  start = time.perf_counter()
+  connection = connect()
+  try:
+    connection.request('POST', '/predict', body, {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response.read()
+    if response.status != 200:
+      raise RuntimeError("Scoring request failed with status %d" % response.status)
+  finally:
+    connection.close()
+  return time.perf_counter()-start
+
+
+def benchmark_server(records, host='127.0.0.1', port=8000, unix_socket=None, requests=1000, concurrency=16, batch=1):
+  """Load generator for scoring_server: `concurrency` clients send `requests` requests of `batch` records.
+
+  Returns the client side p50/p99 latency and the request and row throughput.
+  """
+  if unix_socket:
+    connect = lambda: UnixHTTPConnection(unix_socket)
+  else:
+    connect = lambda: http.client.HTTPConnection(host, port)
+  batches = [[records[(i*batch+j) % len(records)] for j in range(batch)] for i in range(requests)]
+  start = time.perf_counter()
+  with ThreadPoolExecutor(concurrency) as pool:
+    latencies = np.array(list(pool.map(lambda b: post_records(connect, b), batches)))
+  elapsed = time.perf_counter()-start
+  p50, p99 = np.percentile(latencies, [50, 99])*1000
+  return {'requests': requests, 'concurrency': concurrency, 'batch': batch, 'p50_ms': p50, 'p99_ms': p99,
+          'requests_per_second': requests/elapsed, 'rows_per_second': requests*batch/elapsed}
+
+
+SUITE_SIZES = [385, 3850, 38500]          #patients, 1x, 10x and 100x the Kaggle sheet
+BASELINE_FILE = 'benchmarks_baseline.json'
+
+
+def peak_memory(func, *args):
+  """Peak bytes allocated while func runs, NumPy buffers included, and its result."""
+  tracemalloc.start()
+  try:
+    result = func(*args)
+    return tracemalloc.get_traced_memory()[1], result
+  finally:
+    tracemalloc.stop()
+
+
+def measure(size, stage, rows, func, *args, repeats=1, memory=True):
+  """Benchmark row of one stage: best wall time, throughput and peak allocated MB."""
+  seconds, result = best_time(func, *args, repeats=repeats)
+  peak = peak_memory(func, *args)[0]/(1 << 20) if memory else float('nan')
+  return {'patients': size, 'stage': stage, 'rows': rows, 'seconds': seconds,
+          'rows_per_second': rows/seconds if seconds else float('inf'), 'peak_mb': peak}, result
+
+
+def suite(sizes=SUITE_SIZES, models=None, repeats=3, memory=True, random_state=0):
+  """Runs the pre-processing stages, the correlation screening and the fit and predict of every
+  zoo classifier on synthetic cohorts of every size in `sizes` (patients).
+  """
+  from sklearn.model_selection import train_test_split
+  from feature_selection import select_features, target_correlations
+  from model_zoo import zoo_models
+  from synthetic import make_cohort
+  rows = []
+
+  def run(size, stage, n_rows, func, *args):
+    row, result = measure(size, stage, n_rows, func, *args, repeats=repeats, memory=memory)
+    rows.append(row)
+    print("%7d patients  %-28s %9.4fs %9.1f MB" % (size, stage, row['seconds'], row['peak_mb']))
+    return result
+
+  for size in sizes:
+    data = run(size, 'generate', size*5, make_cohort, size, random_state)
+    data = run(size, 'compact_dtypes', len(data), compact_dtypes, data)
+    data_expand = run(size, 'encode', len(data), one_hot_encode, data)
+    df = run(size, 'propagate_labels', len(data_expand), propagate_icu_labels, data_expand)
+    final_data = run(size, 'impute', len(df), impute_first_window, df)
+    final_data = compact_dtypes(final_data.drop(columns=[ID_COLUMN]).dropna(axis=0))
+    run(size, 'target_correlations', len(final_data), target_correlations, final_data)
+    selection = run(size, 'select_features', len(final_data), select_features, final_data)
+
+    X = final_data[selection].to_numpy(dtype=np.float32)
+    y = final_data['ICU'].to_numpy(dtype=int)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.30, random_state=1)
+    for name, estimator in zoo_models().items():
+      if models and name not in models:
+        continue
+      run(size, 'fit ' + name, len(X_train), estimator.fit, X_train, y_train)
+      run(size, 'predict ' + name, len(X_test), estimator.predict, X_test)
+  return pd.DataFrame(rows)
+
+
+def save_baseline(results, path=BASELINE_FILE):
+  baseline = dict(('%d/%s' % (row['patients'], row['stage']), {'seconds': row['seconds'], 'peak_mb': row['peak_mb']})
+                  for row in results.to_dict('records'))
+  with open(path, 'w') as f:
+    json.dump(baseline, f, indent=1, sort_keys=True)
+
+
+def compare_baseline(results, path=BASELINE_FILE, time_tolerance=0.5, memory_tolerance=0.2, min_seconds=0.01):
+  """Results with their baseline time and memory, flagged as regressions when slower than
+  (1 + time_tolerance) x baseline (and by more than min_seconds, the timer noise) or
+  when allocating more than (1 + memory_tolerance) x baseline.
+  """
+  with open(path) as f:
+    baseline = json.load(f)
+  keys = results['patients'].astype(str) + '/' + results['stage']
+  table = results.assign(baseline_seconds=[baseline.get(k, {}).get('seconds', np.nan) for k in keys],
+                         baseline_peak_mb=[baseline.get(k, {}).get('peak_mb', np.nan) for k in keys])
+  slower = (table['seconds'] > table['baseline_seconds']*(1+time_tolerance)) & (table['seconds']-table['baseline_seconds'] > min_seconds)
+  larger = table['peak_mb'] > table['baseline_peak_mb']*(1+memory_tolerance)
+  table['regression'] = slower | larger
+  return table
+
+
+def latency_ms(predict, X, calls=1000):
+  """p50 and p99 in ms of scoring one row at a time."""
+  latencies = np.empty(calls)
+  for i in range(calls):
+    row = X[i % len(X)][None, :]
+    start = time.perf_counter()
+    predict(row)
+    latencies[i] = time.perf_counter()-start
+  return np.percentile(latencies, [50, 99])*1000
+
+
+def compare_compiled(n_patients=3850, calls=1000, repeats=3, random_state=0):
+  """Single row latency and batch throughput of the zoo decision tree and random forest
+  against their compiled_trees form, on a synthetic cohort. The probabilities must be equal.
+  """
+  from sklearn.model_selection import train_test_split
+  from compiled_trees import compile_trees
+  from feature_selection import select_features
+  from model_zoo import zoo_models
+  from synthetic import make_cohort
+  final_data = compact_dtypes(impute_first_window(propagate_icu_labels(one_hot_encode(make_cohort(n_patients, random_state))))
+                              .drop(columns=[ID_COLUMN]).dropna(axis=0))
+  X = final_data[select_features(final_data)].to_numpy(dtype=np.float32)
+  X_train, X_test, y_train, y_test = train_test_split(X, final_data['ICU'].to_numpy(dtype=int), test_size=0.30, random_state=1)
+  rows = []
+  for name in ('Decision Tree', 'Random Forest'):
+    model = zoo_models()[name].fit(X_train, y_train)
+    compiled = compile_trees(model)
+    if not np.array_equal(model.predict_proba(X_test), compiled.predict_proba(X_test)):
+      raise AssertionError("%s: compiled probabilities differ from sklearn" % name)
+    for engine, scorer in (('sklearn', model), ('compiled', compiled)):
+      p50, p99 = latency_ms(scorer.predict_proba, X_test, calls)
+      seconds = best_time(scorer.predict_proba, X_test, repeats=repeats)[0]
+      rows.append({'model': name, 'engine': engine, 'single_p50_ms': p50, 'single_p99_ms': p99,
+                   'batch_rows': len(X_test), 'batch_rows_per_second': len(X_test)/seconds})
+  return pd.DataFrame(rows).set_index(['model', 'engine'])
+
+
+IMPORT_BUDGETS = {'covid19_icu_prediction': 0.05, 'scoring_server': 0.25}     #seconds, NumPy alone takes ~0.1s
+HEAVY_MODULES = ('pandas', 'sklearn', 'scipy', 'matplotlib', 'seaborn', 'joblib', 'tensorflow')
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import %s
+print(json.dumps([time.perf_counter()-start, sorted(m for m in %r if m in sys.modules)]))
+"""
+
+
+def import_time(module, repeats=5):
+  """Best import time of `module` in fresh interpreters and the heavy modules it pulled in."""
+  best, heavy = float('inf'), []
+  for _ in range(repeats):
+    out = subprocess.run([sys.executable, '-c', IMPORT_PROBE % (module, HEAVY_MODULES)],
+                         capture_output=True, text=True, check=True).stdout
+    seconds, heavy = json.loads(out)
+    best = min(best, seconds)
+  return best, heavy
+
+
+def check_import_budgets(budgets=IMPORT_BUDGETS, repeats=5):
+  """Import time of every module against its budget, none of them may import a heavy module."""
+  rows = []
+  for module, budget in budgets.items():
+    seconds, heavy = import_time(module, repeats)
+    rows.append({'module': module, 'seconds': seconds, 'budget': budget, 'heavy_modules': heavy,
+                 'ok': seconds <= budget and not heavy})
+  return pd.DataFrame(rows).set_index('module')
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Pre-processing and scoring server benchmarks')
+  parser.add_argument('dataset', nargs='?', help='Sirio-Libanes workbook for the pre-processing benchmarks')
+  parser.add_argument('--server', help='host:port of a running scoring server')
+  parser.add_argument('--unix-socket', help='Unix socket of a running scoring server')
+  parser.add_argument('--records', help='JSON file with the list of records sent to the server')
+  parser.add_argument('--requests', type=int, default=1000)
+  parser.add_argument('--concurrency', type=int, default=16)
+  parser.add_argument('--batch', type=int, default=1, help='records per request')
+  parser.add_argument('--suite', action='store_true', help='run the stages and classifiers on synthetic cohorts')
+  parser.add_argument('--sizes', default=','.join(map(str, SUITE_SIZES)), help='comma separated cohort sizes in patients')
+  parser.add_argument('--models', help='comma separated zoo models to benchmark, all by default')
+  parser.add_argument('--repeats', type=int, default=3, help='the best of this many runs is reported')
+  parser.add_argument('--no-memory', action='store_true', help='skip the second, traced run of every stage')
+  parser.add_argument('--save-baseline', nargs='?', const=BASELINE_FILE, help='store the suite results as the baseline')
+  parser.add_argument('--baseline', nargs='?', const=BASELINE_FILE, help='compare the suite with a stored baseline, exits 1 on a regression')
+  parser.add_argument('--compiled', action='store_true', help='compare sklearn and compiled_trees inference of the tree models')
+  parser.add_argument('--import-budget', action='store_true', help='check the import time of the entry points, exits 1 over budget')
+  args = parser.parse_args(argv)
+
+  if args.suite:
+    sizes = [int(size) for size in args.sizes.split(',')]
+    models = args.models.split(',') if args.models else None
+    results = suite(sizes, models, args.repeats, memory=not args.no_memory)
+    if args.save_baseline:
+      save_baseline(results, args.save_baseline)
+    if args.baseline:
+      table = compare_baseline(results, args.baseline)
+      print(table.to_string())
+      if table['regression'].any():
+        sys.exit(1)
+    else:
+      print(results.to_string())
+  if args.compiled:
+    print(compare_compiled().to_string())
+  if args.import_budget:
+    budgets = check_import_budgets()
+    print(budgets)
+    if not budgets['ok'].all():
+      sys.exit(1)
+
+  if args.dataset:
+    data = load_dataset(args.dataset)
+    print(memory_report(data))
+    print(compare_imputation(propagate_icu_labels(one_hot_encode(data))))
+  if args.server or args.unix_socket:
+    with open(args.records) as f:
+      records = json.load(f)
+    host, _, port = (args.server or '127.0.0.1:0').partition(':')
+    print(benchmark_server(records, host, int(port), args.unix_socket, args.requests, args.concurrency, args.batch))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Out-of-core pre-processing for extracts that do not fit in memory.
+
+The source, a CSV file or a workbook read row by row with openpyxl in read-only
+mode, is read in chunks of rows that never split a visit, the windows of a
+visit being contiguous as in the Sirio-Libanes sheet. Label propagation,
+first-window imputation and dropna only look at the windows of one visit, so
+they give the same rows per chunk as on the whole frame. Only the hotcoding
+needs global state: its categories are collected by a first streaming pass, so
+every chunk gets the same dummy columns.
+
+The first-window rows are appended to a columnar folder, one raw file per
+column plus a schema, written last:
+
+    <folder>/schema.json     columns, dtypes, rows, the moments of the features (feature_stats.py)
+                             and the hash, size and mtime of the source
+    <folder>/0000.bin ...    column values, appended chunk by chunk
+
+The means, variances and covariances with ICU of the features are accumulated
+while the rows are written, so the features can be screened without reading
+the rows back.
+
+    python3 chunked.py extract.csv first_windows --chunk-rows 200000
+"""
+
+import argparse
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_loading import source_fields
+from feature_selection import UPPER_THRESHOLD, LOWER_THRESHOLD
+from feature_stats import FeatureMoments, reselect
+from preprocessing import (DROP_COLUMNS, ID_COLUMN, LABEL_COLUMN, compact_dtypes, one_hot_encode,
+                           propagate_icu_labels, impute_first_window)
+
+SCHEMA_FILE = 'schema.json'
+
+
+def workbook_chunks(source, chunk_rows=100000):
+  """Chunks of rows of the first sheet of a workbook, the rows streamed by openpyxl in read-only
+  mode so the workbook is never parsed whole as pd.read_excel does.
+  """
+  from openpyxl import load_workbook
+  workbook = load_workbook(source, read_only=True, data_only=True)
+  try:
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header = next(rows, None)
+    rows = (row for row in rows if any(value is not None for value in row))       #blank rows, as pd.read_excel skips them
+    while header is not None:
+      block = list(itertools.islice(rows, chunk_rows))
+      if not block:
+        break
+      chunk = pd.DataFrame.from_records(block, columns=list(header)).infer_objects()
+      for name in chunk.columns[chunk.isna().all().to_numpy()]:
+        chunk[name] = chunk[name].astype(np.float64)            #an empty text column must not look like one in the next pass
+      yield chunk
+  finally:
+    workbook.close()
+
+
+def source_chunks(source, chunk_rows=100000):
+  """Chunks of rows of a CSV file or of a workbook."""
+  if source.endswith('.csv'):
+    return pd.read_csv(source, chunksize=chunk_rows)
+  return workbook_chunks(source, chunk_rows)
+
+
+def visit_aligned(chunks, id_column=ID_COLUMN):
+  """Re-cuts chunks so that the windows of a visit are never split, the trailing visit of a
+  chunk is held back and prepended to the next one.
+  """
+  carry = None
+  for chunk in chunks:
+    if not len(chunk):
+      continue
+    if carry is not None:
+      chunk = pd.concat([carry, chunk], ignore_index=True)
+    last = chunk[id_column].iloc[-1]
+    tail = (chunk[id_column] == last).to_numpy()
+    carry = chunk[tail]
+    if not tail.all():
+      yield chunk[~tail].reset_index(drop=True)
+  if carry is not None and len(carry):
+    yield carry.reset_index(drop=True)
+
+
+def scan_categories(chunks, label_column=LABEL_COLUMN):
+  """First pass: the sorted categories of every text column, as pd.get_dummies would see them on the whole frame."""
+  categories = {}
+  for chunk in chunks:
+    for name in chunk.drop(label_column, axis=1).select_dtypes(exclude='number').columns:
+      categories.setdefault(name, set()).update(str(v) for v in chunk[name].dropna().unique())
+  return dict((name, sorted(values)) for name, values in categories.items())
+
+
+def preprocess_chunk(chunk, categories, drop=DROP_COLUMNS):
+  """Hotcoding with the global categories, label propagation, first-window imputation and dropna of one chunk."""
+  chunk = compact_dtypes(chunk.astype(dict((name, pd.CategoricalDtype(values)) for name, values in categories.items())))     #float32 means like the in-memory path
+  frame = impute_first_window(propagate_icu_labels(one_hot_encode(chunk)))
+  frame = frame.drop([name for name in drop if name in frame.columns], axis=1)
+  return frame.dropna(axis=0).reset_index(drop=True)
+
+
+class ColumnWriter:
+  """Appends frames with the same columns to a folder of raw column files."""
+
+  def __init__(self, folder, columns, dtypes):
+    self.folder = folder
+    self.columns = list(columns)
+    self.dtypes = [np.dtype(dtype) for dtype in dtypes]
+    self.rows = 0
+    os.makedirs(folder, exist_ok=True)
+    if os.path.exists(os.path.join(folder, SCHEMA_FILE)):
+      os.remove(os.path.join(folder, SCHEMA_FILE))           #the folder is invalid until the new schema is written
+    self.files = [open(os.path.join(folder, '%04d.bin' % i), 'wb') for i in range(len(self.columns))]
+
+  def append(self, frame):
+    for f, name, dtype in zip(self.files, self.columns, self.dtypes):
+      frame[name].to_numpy(dtype=dtype).tofile(f)
+    self.rows += len(frame)
+
+  def close(self, **extra):
+    for f in self.files:
+      f.close()
+    schema = dict({'rows': self.rows, 'columns': [{'name': name, 'file': '%04d.bin' % i, 'dtype': str(dtype)}
+                                                   for i, (name, dtype) in enumerate(zip(self.columns, self.dtypes))]}, **extra)
+    with open(os.path.join(self.folder, SCHEMA_FILE), 'w') as f:
+      json.dump(schema, f, indent=1)
+    return schema
+
+
+def read_schema_file(folder):
+  with open(os.path.join(folder, SCHEMA_FILE)) as f:
+    return json.load(f)
+
+
+def read_columns(folder, columns=None, mmap=True):
+  """Frame of a columnar folder written by preprocess_source, the binary columns in the compact schema."""
+  schema = read_schema_file(folder)
+  loaded = {}
+  for entry in schema['columns']:
+    if columns is not None and entry['name'] not in columns:
+      continue
+    path = os.path.join(folder, entry['file'])
+    if mmap and schema['rows']:
+      values = np.memmap(path, dtype=entry['dtype'], mode='r', shape=(schema['rows'],))
+    else:
+      values = np.fromfile(path, dtype=entry['dtype'])
+    loaded[entry['name']] = values
+  return compact_dtypes(pd.DataFrame(loaded, copy=False))
+
+
+def feature_moments(folder):
+  return FeatureMoments.from_dict(read_schema_file(folder)['moments'])
+
+
+def preprocess_source(source, folder, chunk_rows=100000, drop=DROP_COLUMNS):
+  """Streams `source` twice: once for the hotcoding categories, once to pre-process it
+  chunk by chunk into `folder`. Returns the schema of the written folder.
+  """
+  categories = scan_categories(source_chunks(source, chunk_rows))
+  writer = moments = None
+  for chunk in visit_aligned(source_chunks(source, chunk_rows)):
+    frame = preprocess_chunk(chunk, categories, drop)
+    if writer is None:
+      features = [name for name in frame.columns if name != LABEL_COLUMN]
+      writer = ColumnWriter(folder, frame.columns, [np.uint8 if name == LABEL_COLUMN else np.float32 for name in frame.columns])
+      moments = FeatureMoments(features)
+    writer.append(frame)
+    moments.update(frame)
+  if writer is None:
+    raise ValueError("No rows in source %s" % source)
+  return writer.close(categories=categories, moments=moments.to_dict(), **source_fields(source))
+
+
+def select_from_folder(folder, upper=UPPER_THRESHOLD, lower=LOWER_THRESHOLD, candidates=None):
+  """select_features on the rows of a folder, from its feature moments only."""
+  return reselect(feature_moments(folder), upper, lower, candidates)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Out-of-core pre-processing of a Sirio-Libanes style extract')
+  parser.add_argument('source', help='CSV extract or Sirio-Libanes workbook')
+  parser.add_argument('folder', help='columnar folder of the pre-processed first windows')
+  parser.add_argument('--chunk-rows', type=int, default=100000)
+  args = parser.parse_args(argv)
+  schema = preprocess_source(args.source, args.folder, args.chunk_rows)
+  print("Wrote", schema['rows'], "first windows of", len(schema['columns']), "columns to", args.folder)
+  print("Selected:", select_from_folder(args.folder))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Cohort statistics split by ICU label, computed in one pass.
+
+summarize() returns a tidy frame with one row per (feature, cohort):
+
+    feature   column name
+    kind      'binary' for the comorbidities and hotcoded age percentiles, or the
+              name of a feature group such as 'vital' or 'lab'
+    cohort    'non_icu', 'icu' or 'all'
+    rows      patients in the cohort
+    count     patients with a value for the feature
+    sum       sum of the values, the number of positives for a binary feature
+    mean      sum/count, the prevalence for a binary feature
+
+All the sums and counts come from two matrix products of the label one-hot
+with the feature matrix, so the cost is one pass over the rows however many
+features are summarized.
+"""
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import LABEL_COLUMN
+
+AGE_PERCENTILE_COLUMNS = ['AGE_PERCENTIL_10th', 'AGE_PERCENTIL_20th', 'AGE_PERCENTIL_30th', 'AGE_PERCENTIL_40th',
+                          'AGE_PERCENTIL_50th', 'AGE_PERCENTIL_60th', 'AGE_PERCENTIL_70th', 'AGE_PERCENTIL_80th',
+                          'AGE_PERCENTIL_90th', 'AGE_PERCENTIL_Above 90th']
+COMORBIDITY_COLUMNS = ['DISEASE GROUPING 1', 'DISEASE GROUPING 2', 'DISEASE GROUPING 3', 'DISEASE GROUPING 4',
+                       'DISEASE GROUPING 5', 'DISEASE GROUPING 6', 'HTN', 'IMMUNOCOMPROMISED']
+BINARY_FEATURES = ['AGE_ABOVE65'] + AGE_PERCENTILE_COLUMNS + COMORBIDITY_COLUMNS
+COHORTS = ['non_icu', 'icu']               #label 0 and 1
+
+
+def summarize(data, binary=BINARY_FEATURES, groups=None, label_column=LABEL_COLUMN):
+  """Tidy summary of the `binary` columns and of every {kind: columns} of `groups`, see the module docstring.
+
+  Columns missing from `data` are skipped. A column listed twice keeps its first kind.
+  """
+  kinds = dict((name, 'binary') for name in binary if name in data.columns)
+  for kind, names in (groups or {}).items():
+    for name in names:
+      if name in data.columns:
+        kinds.setdefault(name, kind)
+  features = list(kinds)
+
+  values = data[features].to_numpy(dtype=np.float64)
+  present = ~np.isnan(values)
+  label = data[label_column].to_numpy()
+  onehot = np.stack([label == 0, label == 1]).astype(np.float64)       #cohorts x rows
+  sums = onehot @ np.where(present, values, 0)
+  counts = onehot @ present
+  rows = onehot.sum(axis=1)
+  sums = np.vstack([sums, sums.sum(axis=0)])                           #the 'all' cohort
+  counts = np.vstack([counts, counts.sum(axis=0)])
+  rows = np.append(rows, rows.sum())
+
+  cohorts = COHORTS + ['all']
+  with np.errstate(divide='ignore', invalid='ignore'):
+    means = sums/counts
+  return pd.DataFrame({'feature': np.tile(features, len(cohorts)),
+                       'kind': np.tile([kinds[name] for name in features], len(cohorts)),
+                       'cohort': np.repeat(cohorts, len(features)),
+                       'rows': np.repeat(rows, len(features)).astype(np.int64),
+                       'count': counts.ravel().astype(np.int64),
+                       'sum': sums.ravel(),
+                       'mean': means.ravel()})
+
+
+def cohort_table(summary, features, value='mean'):
+  """`value` of the given features (rows, in their order) for every cohort (columns)."""
+  table = summary[summary['feature'].isin(features)].pivot(index='feature', columns='cohort', values=value)
+  return table.reindex(index=list(features), columns=COHORTS + ['all'])
+
+
+def cohort_sizes(summary):
+  """Patients in every cohort."""
+  return summary.drop_duplicates('cohort').set_index('cohort')['rows']
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Array-based inference for the decision tree and random forest models.
+
+The nodes of every tree are concatenated into flat arrays:
+
+    feature     int32    split feature, 0 in the leaves
+    threshold   float64  go left when x[feature] <= threshold, +inf in the leaves
+    left/right  int32    children as global node indices, a leaf points to itself
+    value       float64  class probabilities of the node (rows x classes)
+    roots       int32    first node of every tree
+
+A batch is scored over all trees at once: every (tree, row) pair holds a node
+index, and each step moves all of them one level down with a few fancy-index
+operations. A leaf points to itself, so the traversal simply runs for the depth
+of the deepest tree. Inputs are compared as float32 against float64 thresholds
+and the tree probabilities are summed in tree order, as sklearn does, so the
+probabilities are exactly sklearn's. The inputs must not have NaN values, like
+the rows the models are trained on.
+"""
+
+import numpy as np
+
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'classes')
+
+
+class CompiledTrees:
+  """predict_proba/predict of a fitted DecisionTreeClassifier or RandomForestClassifier from node arrays."""
+
+  def __init__(self, feature, threshold, left, right, value, roots, classes, block_rows=4096):
+    self.feature = feature
+    self.threshold = threshold
+    self.left = left
+    self.right = right
+    self.value = value
+    self.roots = roots
+    self.classes_ = classes
+    self.depth = self.max_depth()
+    self.block_rows = block_rows
+    self.feature_index = feature.astype(np.intp)
+    self.children = np.stack([right, left], axis=1).ravel().astype(np.intp)      #child of node n is children[2n + go_left]
+
+  @classmethod
+  def from_estimator(cls, model):
+    estimators = getattr(model, 'estimators_', [model])
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in estimators:
+      tree = estimator.tree_
+      leaf = tree.children_left == -1
+      nodes = np.arange(tree.node_count)
+      features.append(np.where(leaf, 0, tree.feature))
+      thresholds.append(np.where(leaf, np.inf, tree.threshold))
+      lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+      rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+      value = tree.value[:, 0, :len(model.classes_)]
+      normalizer = value.sum(axis=1, keepdims=True)
+      normalizer[normalizer == 0] = 1
+      values.append(value/normalizer)                 #the normalisation of DecisionTreeClassifier.predict_proba
+      roots.append(offset)
+      offset += tree.node_count
+    return cls(np.concatenate(features).astype(np.int32), np.concatenate(thresholds),
+               np.concatenate(lefts).astype(np.int32), np.concatenate(rights).astype(np.int32),
+               np.ascontiguousarray(np.concatenate(values)), np.array(roots, dtype=np.int32), np.asarray(model.classes_))
+
+  def max_depth(self):
+    """Levels until every root reaches a leaf, found by walking all the trees level by level."""
+    nodes, depth = self.roots, 0
+    while True:
+      children = np.concatenate([self.left[nodes], self.right[nodes]])
+      inner = children != np.concatenate([nodes, nodes])
+      if not inner.any():
+        return depth
+      nodes = np.unique(children[inner])
+      depth += 1
+
+  def leaves(self, X):
+    """Leaf index of every (tree, row) pair, shape (trees, rows)."""
+    rows, cols = X.shape
+    values = np.ascontiguousarray(X).ravel()
+    offsets = np.arange(rows, dtype=np.intp)*cols               #start of every row in the flat X
+    nodes = np.repeat(self.roots.astype(np.intp)[:, None], rows, axis=1)
+    for _ in range(self.depth):
+      go_left = values[offsets + self.feature_index[nodes]] <= self.threshold[nodes]
+      nodes = self.children[2*nodes + go_left]
+    return nodes
+
+  def predict_proba(self, X):
+    X = np.asarray(X, dtype=np.float32)            #trees split on float32 values
+    if X.ndim == 1:
+      X = X[None, :]
+    proba = np.empty((len(X), len(self.classes_)))
+    for start in range(0, len(X), self.block_rows):     #bounds the (trees, rows) index arrays
+      leaves = self.leaves(X[start:start+self.block_rows])
+      total = self.value[leaves[0]].copy()
+      for tree_leaves in leaves[1:]:
+        total += self.value[tree_leaves]            #tree by tree, in the order of sklearn's accumulation
+      proba[start:start+len(total)] = total/len(self.roots)
+    return proba
+
+  def predict(self, X):
+    return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+  def arrays(self):
+    return dict((name, getattr(self, 'classes_' if name == 'classes' else name)) for name in ARRAYS)
+
+  def save(self, path):
+    np.savez(path, **self.arrays())
+
+  @classmethod
+  def load(cls, path):
+    with np.load(path, allow_pickle=False) as arrays:
+      return cls(*(np.asarray(arrays[name]) for name in ARRAYS))
+
+
+def compile_trees(model):
+  """Node arrays of a fitted tree or forest, or None for any other model."""
+  if not hasattr(getattr(model, 'estimators_', [model])[0], 'tree_'):
+    return None
+  return CompiledTrees.from_estimator(model)
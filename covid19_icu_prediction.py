@@ -22,713 +22,568 @@ and take critical decisions like shifting patient to another
 hospital or arrangement of resources within the time so
 that the lives of patients can be saved.
 
-##Libraries and Packages
-List of all the packages that is used in the notebook
-"""
+Every section of the notebook is a function below and `main()` runs them in
+order. Importing this module is free: pandas, scikit-learn, matplotlib and
+seaborn are imported inside the sections that need them. The figures are
+rendered by worker processes into a report folder (see report.py) instead of
+being shown.
 
-import tensorflow as tf
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-from sklearn.manifold import TSNE 
-from sklearn.decomposition import PCA 
+    python3 covid19_icu_prediction.py --help
+"""
 
-pd.set_option('display.max_columns', None)
+import argparse
+import os
 
-"""Downloading Dataset
+DATASET_FILE = "Kaggle_Sirio_Libanes_ICU_Prediction.xlsx"
+SEARCH_MODE = 'grid'                   #'grid' for exhaustive grid searches, 'halving' for successive halving
+RF_N_JOBS = -1                         #parallel jobs for the random forests, -1 uses every core
+ZOO_WORKERS = -1                       #worker processes training the model zoo, -1 uses every core
+ARTIFACT_ROOT = 'artifacts'            #versioned models served by scoring_server.py
+REPORT_ROOT = 'reports'                #one folder of figures and index.html per run
+STATS_ROOT = 'feature_stats'           #moments of the features of every dataset seen, for drift monitoring
+STAGE_CACHE = 'stages.cache'           #outputs of the pipeline stages, reused while their inputs do not change
+STAGE_CACHE_MB = 2048                  #least recently used stage outputs are evicted above this size
 
-"""
+VITAL_FEATURES = ['BLOODPRESSURE_DIASTOLIC_MEAN',
+       'RESPIRATORY_RATE_MEAN', 'TEMPERATURE_MEAN', 'OXYGEN_SATURATION_MEAN',
+       'BLOODPRESSURE_SISTOLIC_MIN', 'HEART_RATE_MIN', 'RESPIRATORY_RATE_MIN',
+       'TEMPERATURE_MIN', 'BLOODPRESSURE_DIASTOLIC_MAX',
+       'BLOODPRESSURE_SISTOLIC_MAX', 'HEART_RATE_MAX', 'OXYGEN_SATURATION_MAX',
+       'HEART_RATE_DIFF', 'RESPIRATORY_RATE_DIFF', 'TEMPERATURE_DIFF']
+LAB_FEATURES = ['HTN', 'BIC_VENOUS_MEAN', 'CALCIUM_MEAN',
+       'CREATININ_MEAN', 'GLUCOSE_MEAN', 'INR_MEAN', 'LACTATE_MEAN',
+       'LEUKOCYTES_MEAN', 'LINFOCITOS_MEAN', 'NEUTROPHILES_MEAN',
+       'PC02_VENOUS_MEAN', 'PCR_MEAN', 'PLATELETS_MEAN', 'SAT02_VENOUS_MEAN',
+       'SODIUM_MEAN', 'UREA_MEAN']
 
-!wget -O "Kaggle_Sirio_Libanes_ICU_Prediction.xlsx" "https://drive.google.com/uc?export=download&id=1_shaH6SQajy1zrnALzim9jGaRmF3PLIn"
 
 """##Reading Dataset
-Reading the dataset from the given CSV file.
+Downloading the dataset once and reading it from the columnar cache built from the given xlsx file.
 """
 
-data = pd.read_excel("Kaggle_Sirio_Libanes_ICU_Prediction.xlsx")
-data
+def load_data(source=DATASET_FILE):
+  from data_loading import download_dataset, load_dataset
+  from preprocessing import compact_dtypes
+  return compact_dtypes(load_dataset(download_dataset(source)))          #binary columns as uint8 and measurements as float32
+
 
 """##Data Pre-Processing
 Converting the data into usable format.
 Following modifications has been done to the data to get most out of it:
 1. Binary hotcoding to convert not float columns.
-2. Marking Window 0-2 as 1 if the patient was admitted to ICU in any of the future windows. 
+2. Marking Window 0-2 as 1 if the patient was admitted to ICU in any of the future windows.
 3. Removing all the records of the windows in which patients were actually admitted to the ICU (windows with ICU label 1 before the step 2).
 4. Filling the NaN values of window 0-2 with the help of mean of values in all the windows of that patient.
 5. Removing all the rows still having NaN values.
 
 """
 
-print(data.dtypes)
-data.select_dtypes(object)
-
-without_ICU_column = data.drop('ICU', axis = 1)       #seperating the ICU lable column
-ICU_column = data['ICU']
-colums_to_convert = data.select_dtypes(object).columns   #finding columns that are not of type float or int
-colums_to_convert
-
-without_ICU_column = pd.get_dummies(without_ICU_column, columns = colums_to_convert)      #performing hotcoding
-without_ICU_column.head()
-
-data_expand = pd.concat([without_ICU_column, ICU_column], axis = 1)         #adding the ICU column again at the last position
-data_expand.head(5)
-
-column_names = data_expand.columns
-arr = data_expand.to_numpy()
-print(arr)
-i=0
-ICU_admitted_rows = []
-while(i<len(arr)):            #loop to record the rows in which patient is admitted to the ICU and adding 1 label to the previous rows.
-  for j in range(5):
-    if(arr[i+j][-1]==1):
-      for k in range(j):
-        arr[i+k][-1]=1
-      for toremove in range(i+j,i+5):
-        ICU_admitted_rows.append(toremove)
-      break
-  i+=5
-print(ICU_admitted_rows)
-deletedcount = 0
-for rowToRemove in ICU_admitted_rows:             #removing the rows in which patient was admitted to the ICU
-  arr = np.delete(arr, rowToRemove-deletedcount, axis=0)
-  deletedcount+=1
-df = pd.DataFrame(arr, columns = column_names)
-df.head(10)
-
-#Filling missing values
-pd.options.mode.chained_assignment = None 
-edited_dfs_list = []
-max_patient_id = df['PATIENT_VISIT_IDENTIFIER'].max()
-for i in range(int(max_patient_id)):                      #keeping only the first window that is 0-2 for every patient and filling NaN values with mean of all windows
-  tempdf = df[df['PATIENT_VISIT_IDENTIFIER']==i]
-  if(len(tempdf)!=0):
-    tempdf.fillna(tempdf.mean(), inplace=True)
-    tempdf = tempdf.iloc[[0]]
-    edited_dfs_list.append(tempdf)
-
-  
-final_data = pd.concat(edited_dfs_list)
-final_data.head(30)
-
-final_data = final_data.drop(['GENDER','PATIENT_VISIT_IDENTIFIER','WINDOW_0-2',	'WINDOW_2-4',	'WINDOW_4-6',	'WINDOW_6-12',	'WINDOW_ABOVE_12'],axis = 1)
-final_data.head()
-
-final_data.describe()
-
-final_data = final_data.dropna(axis = 0)            #Now we must have to drop the rows having nan values as there is no data in any window to fill it.
+def encode(data):
+  from preprocessing import one_hot_encode
+  return one_hot_encode(data)          #performing hotcoding of the not float columns, the ICU column stays at the last position
 
-"""##Data Analysis
-Visualising the pre preoessed data and trying to get the intution about different characterstics.
-"""
 
-final_data.describe()
-
-ICU_admission_distribution = final_data['ICU'].value_counts()
-print("Total Patients after pre processing: ", sum(ICU_admission_distribution))
-print("Distribution of ICU admissions")
-print("Patients who were not admitted to ICU: ",ICU_admission_distribution[0])
-print("Patients who were admitted to ICU: ",ICU_admission_distribution[1])
-labels= ['Admitted to ICU', 'Not Admitted to ICU']
-colors=['tomato', 'deepskyblue']
-sizes= [ICU_admission_distribution[1], ICU_admission_distribution[0]]
-plt.pie(sizes,labels=labels, colors=colors, startangle=90, autopct='%1.1f%%')
-plt.title("ICU Distribution of data")
-plt.axis('equal')
-plt.show()
-
-Age_distribution = final_data['AGE_ABOVE65'].value_counts()
-print("Age Distribution")
-print("Patients below age 65: ",Age_distribution[0])
-print("Patients above age 65: ",Age_distribution[1])
-labels= ['Below 65', 'Above 65']
-colors=['lightgreen', 'violet']
-sizes= [Age_distribution[0], Age_distribution[1]]
-plt.pie(sizes,labels=labels, colors=colors, startangle=90, autopct='%1.1f%%')
-plt.axis('equal')
-plt.title("Age Distribution of data")
-plt.show()
-
-ICU_Admitted_data = final_data[final_data['ICU']==1]
-Age_distribution = ICU_Admitted_data['AGE_ABOVE65'].value_counts()
-print("Age Distribution")
-print("Patients below age 65: ",Age_distribution[0])
-print("Patients above age 65: ",Age_distribution[1])
-labels= ['Below 65', 'Above 65']
-colors=['orange', 'cyan']
-sizes= [Age_distribution[0], Age_distribution[1]]
-plt.pie(sizes,labels=labels, colors=colors, startangle=90, autopct='%1.1f%%')
-plt.axis('equal')
-plt.title("Age Distribution of ICU Admitted patients")
-plt.show()
-
-x = [[],[]]
-x[0].append(final_data['AGE_PERCENTIL_10th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_20th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_30th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_40th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_50th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_60th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_70th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_80th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_90th'].value_counts()[1])
-x[0].append(final_data['AGE_PERCENTIL_Above 90th'].value_counts()[1])
-
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_10th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_20th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_30th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_40th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_50th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_60th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_70th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_80th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_90th'].value_counts()[1])
-x[1].append(ICU_Admitted_data['AGE_PERCENTIL_Above 90th'].value_counts()[1])
-
-a = []
-c=1
-for i in x[0]:
-  a.extend([c*10]*i)
-  c+=1
-plt.hist(a, 20, label='Total')
-b = []
-c=1
-for i in x[1]:
-  b.extend([c*10]*i)
-  c+=1
-print(x)
-plt.hist(b, 20, label='ICU Admitted')
-plt.xticks([10,20,30,40,50,60,70,80,90,100],['AGE_PERCENTIL_10th','AGE_PERCENTIL_20th','AGE_PERCENTIL_30th','AGE_PERCENTIL_40th','AGE_PERCENTIL_50th','AGE_PERCENTIL_60th','AGE_PERCENTIL_70th','AGE_PERCENTIL_80th','AGE_PERCENTIL_90th','AGE_PERCENTIL_Above 90'], rotation = 70)
-plt.legend()
-plt.ylabel('Frequency')
-plt.title('Age Distribution Total and ICU Admitted')
-plt.show()
-
-Diesease_Grouping_1 = final_data['DISEASE GROUPING 1'].value_counts()
-Diesease_Grouping_2 = final_data['DISEASE GROUPING 2'].value_counts()
-Diesease_Grouping_3 = final_data['DISEASE GROUPING 3'].value_counts()
-Diesease_Grouping_4 = final_data['DISEASE GROUPING 4'].value_counts()
-Diesease_Grouping_5 = final_data['DISEASE GROUPING 5'].value_counts()
-Diesease_Grouping_6 = final_data['DISEASE GROUPING 6'].value_counts()
-HTN_total = final_data['HTN'].value_counts()
-Immunocompromised_total = final_data['IMMUNOCOMPROMISED'].value_counts()
-Other_total = final_data['OTHER'].value_counts()
-
-ICU_Diesease_Grouping_1 = ICU_Admitted_data['DISEASE GROUPING 1'].value_counts()
-ICU_Diesease_Grouping_2 = ICU_Admitted_data['DISEASE GROUPING 2'].value_counts()
-ICU_Diesease_Grouping_3 = ICU_Admitted_data['DISEASE GROUPING 3'].value_counts()
-ICU_Diesease_Grouping_4 = ICU_Admitted_data['DISEASE GROUPING 4'].value_counts()
-ICU_Diesease_Grouping_5 = ICU_Admitted_data['DISEASE GROUPING 5'].value_counts()
-ICU_Diesease_Grouping_6 = ICU_Admitted_data['DISEASE GROUPING 6'].value_counts()
-HTN_ICU = ICU_Admitted_data['HTN'].value_counts()
-Immunocompromised_ICU = ICU_Admitted_data['IMMUNOCOMPROMISED'].value_counts()
-Other_ICU = ICU_Admitted_data['OTHER'].value_counts()
-
-x = np.array([[Diesease_Grouping_1[1],Diesease_Grouping_2[1],Diesease_Grouping_3[1],Diesease_Grouping_4[1],Diesease_Grouping_5[1],Diesease_Grouping_6[1],HTN_total[1], Immunocompromised_total[1]],[ICU_Diesease_Grouping_1[1],ICU_Diesease_Grouping_2[1],ICU_Diesease_Grouping_3[1],ICU_Diesease_Grouping_4[1],ICU_Diesease_Grouping_5[1],ICU_Diesease_Grouping_6[1],HTN_ICU[1], Immunocompromised_ICU[1]]])
-a = []
-c=1
-for i in x[0]:
-  a.extend([c]*i)
-  c+=1
-plt.hist(a, 15, label='Total')
-b = []
-c=1
-for i in x[1]:
-  b.extend([c]*i)
-  c+=1
-print(x)
-plt.hist(b, 15, label='ICU Admitted')
-plt.xticks([1,2,3,4,5,6,7,8,9],['Diesease_Grouping_1','Diesease_Grouping_2','Diesease_Grouping_3','Diesease_Grouping_4','Diesease_Grouping_5','Diesease_Grouping_6', 'Hypertension', 'Immunocompromised'], rotation = 70)
-plt.legend()
-plt.ylabel('Frequency')
-plt.title('Disease Distribution Total and ICU Admitted')
-plt.show()
-
-import seaborn as sns
-corr = final_data.corr()
-corr.shape
-plt.subplots(figsize=(100,100))
-ax = sns.heatmap(
-    corr, 
-    vmin=-1, vmax=1, center=0,
-    cmap=sns.diverging_palette(20, 220, n=200),
-    square=True
-)
-ax.set_xticklabels(
-    ax.get_xticklabels(),
-    rotation=90,
-    horizontalalignment='right'
-);
-corr.tail()
-
-corr.shape
-ICU_corr = corr.iloc[236]
-ICU_corr.describe()
-
-ICU_corr = np.array(ICU_corr)
-selection = []
-for i in ICU_corr:
-  if(i):
-    if(i>0.11):
-      selection.append(True)
-    elif(i<-0.12):
-      selection.append(True)
-    else:
-      selection.append(False)
-  else:
-    selection.append(False)
-
-print(len(selection), selection.count(True))
-selection = np.array(selection)
-selected_final_data = final_data.loc[:, selection]
-selected_final_data.head()
-
-selected_final_data = selected_final_data[['AGE_ABOVE65', 'DISEASE GROUPING 2', 'DISEASE GROUPING 3', 'DISEASE GROUPING 4',
-                                           'HTN', 'BIC_VENOUS_MEAN', 'CALCIUM_MEAN' , 'CREATININ_MEAN', 'GLUCOSE_MEAN', 'INR_MEAN',
-                                           'LACTATE_MEAN', 'LEUKOCYTES_MEAN', 'LINFOCITOS_MEAN', 'NEUTROPHILES_MEAN', 'PC02_VENOUS_MEAN',
-                                           'PCR_MEAN', 'PLATELETS_MEAN', 'SAT02_VENOUS_MEAN', 'SODIUM_MEAN', 'UREA_MEAN', 'BLOODPRESSURE_DIASTOLIC_MEAN',
-                                           'RESPIRATORY_RATE_MEAN', 'TEMPERATURE_MEAN', 'OXYGEN_SATURATION_MEAN', 'BLOODPRESSURE_SISTOLIC_MIN',
-                                           'HEART_RATE_MIN', 'RESPIRATORY_RATE_MIN', 'TEMPERATURE_MIN', 'BLOODPRESSURE_DIASTOLIC_MAX', 'BLOODPRESSURE_SISTOLIC_MAX',
-                                           'HEART_RATE_MAX', 'OXYGEN_SATURATION_MAX', 'BLOODPRESSURE_DIASTOLIC_DIFF', 'BLOODPRESSURE_SISTOLIC_DIFF', 
-                                           'HEART_RATE_DIFF', 'RESPIRATORY_RATE_DIFF', 'TEMPERATURE_DIFF', 'OXYGEN_SATURATION_DIFF', 
-                                           'AGE_PERCENTIL_10th', 'AGE_PERCENTIL_20th', 'AGE_PERCENTIL_80th', 'AGE_PERCENTIL_90th', 'ICU']]
-
-print(selected_final_data.shape)
-selected_final_data.head()
-
-corr = selected_final_data.corr()
-corr.shape
-plt.subplots(figsize=(30,30))
-ax = sns.heatmap(
-    corr, 
-    vmin=-1, vmax=1, center=0,
-    cmap=sns.diverging_palette(20, 220, n=200),
-    square=True
-)
-ax.set_xticklabels(
-    ax.get_xticklabels(),
-    rotation=90,
-    horizontalalignment='right'
-);
-corr.tail()
-
-selected_final_data.columns
-
-Non_ICU_Admitted_data = selected_final_data[selected_final_data['ICU']==0]
-ICU_Admitted_data = selected_final_data[selected_final_data['ICU']==1]
-
-Vital_Non_ICU_Admitted_data = Non_ICU_Admitted_data[['BLOODPRESSURE_DIASTOLIC_MEAN',
-       'RESPIRATORY_RATE_MEAN', 'TEMPERATURE_MEAN', 'OXYGEN_SATURATION_MEAN',
-       'BLOODPRESSURE_SISTOLIC_MIN', 'HEART_RATE_MIN', 'RESPIRATORY_RATE_MIN',
-       'TEMPERATURE_MIN', 'BLOODPRESSURE_DIASTOLIC_MAX',
-       'BLOODPRESSURE_SISTOLIC_MAX', 'HEART_RATE_MAX', 'OXYGEN_SATURATION_MAX',
-       'HEART_RATE_DIFF', 'RESPIRATORY_RATE_DIFF', 'TEMPERATURE_DIFF']]
+def propagate(data_expand):
+  from preprocessing import propagate_icu_labels
+  return propagate_icu_labels(data_expand)       #marking earlier windows of ICU admitted patients with 1 and removing the windows spent in the ICU
 
-Vital_ICU_Admitted_data = ICU_Admitted_data[['BLOODPRESSURE_DIASTOLIC_MEAN',
-       'RESPIRATORY_RATE_MEAN', 'TEMPERATURE_MEAN', 'OXYGEN_SATURATION_MEAN',
-       'BLOODPRESSURE_SISTOLIC_MIN', 'HEART_RATE_MIN', 'RESPIRATORY_RATE_MIN',
-       'TEMPERATURE_MIN', 'BLOODPRESSURE_DIASTOLIC_MAX',
-       'BLOODPRESSURE_SISTOLIC_MAX', 'HEART_RATE_MAX', 'OXYGEN_SATURATION_MAX',
-       'HEART_RATE_DIFF', 'RESPIRATORY_RATE_DIFF', 'TEMPERATURE_DIFF']]
 
+def impute(df):
+  from preprocessing import DROP_COLUMNS, compact_dtypes, impute_first_window
+  final_data = impute_first_window(df)          #keeping only the first window that is 0-2 for every patient and filling NaN values with mean of all windows
+  final_data = final_data.drop(DROP_COLUMNS,axis = 1)
+  final_data = final_data.dropna(axis = 0)            #Now we must have to drop the rows having nan values as there is no data in any window to fill it.
+  return compact_dtypes(final_data)             #imputed binary columns back to uint8
 
-Lab_Non_ICU_Admitted_data = Non_ICU_Admitted_data[['HTN', 'BIC_VENOUS_MEAN', 'CALCIUM_MEAN',
-       'CREATININ_MEAN', 'GLUCOSE_MEAN', 'INR_MEAN', 'LACTATE_MEAN',
-       'LEUKOCYTES_MEAN', 'LINFOCITOS_MEAN', 'NEUTROPHILES_MEAN',
-       'PC02_VENOUS_MEAN', 'PCR_MEAN', 'PLATELETS_MEAN', 'SAT02_VENOUS_MEAN',
-       'SODIUM_MEAN', 'UREA_MEAN']]
-Lab_ICU_Admitted_data = ICU_Admitted_data[['HTN', 'BIC_VENOUS_MEAN', 'CALCIUM_MEAN',
-       'CREATININ_MEAN', 'GLUCOSE_MEAN', 'INR_MEAN', 'LACTATE_MEAN',
-       'LEUKOCYTES_MEAN', 'LINFOCITOS_MEAN', 'NEUTROPHILES_MEAN',
-       'PC02_VENOUS_MEAN', 'PCR_MEAN', 'PLATELETS_MEAN', 'SAT02_VENOUS_MEAN',
-       'SODIUM_MEAN', 'UREA_MEAN']]
-
-
-# set width of bar 
-barWidth = 0.25
-fig = plt.subplots(figsize =(20, 10)) 
-   
-vital_non_ICU = np.array(Vital_Non_ICU_Admitted_data.mean(axis=0)) 
-vital_ICU = np.array(Vital_ICU_Admitted_data.mean(axis=0)) 
-   
-# Set position of bar on X axis 
-br1 = np.arange(len(vital_ICU)) + (barWidth*0.5)
-br2 = [x + barWidth for x in br1]  
-   
-# Make the plot 
-plt.bar(br2, vital_ICU, color ='r', width = barWidth, edgecolor ='grey', label ='ICU Admitted') 
-plt.bar(br1, vital_non_ICU, color ='b', width = barWidth, edgecolor ='grey', label ='NOT Admitted') 
-
-   
-plt.xlabel('Features', fontweight ='bold') 
-plt.ylabel('Normalized Values', fontweight ='bold') 
-plt.xticks([r + barWidth for r in range(len(vital_ICU))], ['BLOODPRESSURE_DIASTOLIC_MEAN',
-       'RESPIRATORY_RATE_MEAN', 'TEMPERATURE_MEAN', 'OXYGEN_SATURATION_MEAN',
-       'BLOODPRESSURE_SISTOLIC_MIN', 'HEART_RATE_MIN', 'RESPIRATORY_RATE_MIN',
-       'TEMPERATURE_MIN', 'BLOODPRESSURE_DIASTOLIC_MAX',
-       'BLOODPRESSURE_SISTOLIC_MAX', 'HEART_RATE_MAX', 'OXYGEN_SATURATION_MAX',
-       'HEART_RATE_DIFF', 'RESPIRATORY_RATE_DIFF', 'TEMPERATURE_DIFF'], rotation = 90) 
-
-plt.legend()
-plt.title("Vital Signs of Covid19 Patients")
-plt.show()
-
-
-# set width of bar 
-barWidth = 0.25
-fig = plt.subplots(figsize =(20, 10)) 
-   
-lab_non_ICU = np.array(Lab_Non_ICU_Admitted_data.mean(axis=0)) 
-lab_ICU = np.array(Lab_ICU_Admitted_data.mean(axis=0)) 
-   
-# Set position of bar on X axis 
-br1 = np.arange(len(lab_ICU)) + (barWidth*0.5)
-br2 = [x + barWidth for x in br1]  
-   
-# Make the plot 
-plt.bar(br2, lab_ICU, color ='r', width = barWidth, edgecolor ='grey', label ='ICU Admitted') 
-plt.bar(br1, lab_non_ICU, color ='b', width = barWidth, edgecolor ='grey', label ='NOT Admitted') 
-
-   
-plt.xlabel('Features', fontweight ='bold') 
-plt.ylabel('Normalized Value', fontweight ='bold') 
-plt.legend()
-plt.xticks([r + barWidth for r in range(len(lab_ICU))], ['HTN', 'BIC_VENOUS_MEAN', 'CALCIUM_MEAN',
-       'CREATININ_MEAN', 'GLUCOSE_MEAN', 'INR_MEAN', 'LACTATE_MEAN',
-       'LEUKOCYTES_MEAN', 'LINFOCITOS_MEAN', 'NEUTROPHILES_MEAN',
-       'PC02_VENOUS_MEAN', 'PCR_MEAN', 'PLATELETS_MEAN', 'SAT02_VENOUS_MEAN',
-       'SODIUM_MEAN', 'UREA_MEAN'], rotation = 90) 
-plt.title("Lab Test Results of Covid19 patients")
-plt.show()
-
-X_data = np.array(selected_final_data.drop(['ICU'], axis = 1))
-Y_data = np.array(selected_final_data[['ICU']])
-print(X_data.shape)
-print(Y_data.shape)
-from sklearn.decomposition import PCA 
-
-labels = []
-for i in Y_data:
-  if(i[0]==0):
-    labels.append(0)
-  else:
-    labels.append(1)
-print(X_data)
-Y_data = np.array(labels)
-
-#pca = PCA(0.80)
-#X_data = pca.fit_transform(X_data)
-print("pca ", X_data.shape)
-model = TSNE(n_components = 2, random_state = 0) 
-  
-tsne_data = model.fit_transform(X_data) 
-
-
-# creating a new data frame which 
-# help us in ploting the result data 
-tsne_data = np.vstack((tsne_data.T, Y_data)).T 
-tsne_df = pd.DataFrame(data = tsne_data, 
-     columns =("Dim_1", "Dim_2","label")) 
-  
-# Ploting the result of tsne 
-sns.FacetGrid(tsne_df, hue ="label", size = 6).map( 
-       plt.scatter, 'Dim_1', 'Dim_2', s = 100).add_legend() 
-  
-plt.show()
-
-selected_final_data.head()
-
-print(X_data)
-print(Y_data)
 
-"""## Training and Testing using various classifiers
+def preprocess(data):
+  return impute(propagate(encode(data)))
+
 
-Importing Libraries
+def first_windows_folder(source):
+  return os.path.splitext(source)[0] + '.first_windows.cache'
+
+
+def preprocess_chunked(source, chunk_rows=100000):
+  """Same rows as preprocess(load_data(source)) without ever holding the whole source in memory:
+  the source is streamed in chunks that never split a patient (see chunked.py).
+  Returns the pre-processed first windows and the hotcoding categories.
+  """
+  from chunked import preprocess_source, read_columns
+  folder = first_windows_folder(source)
+  schema = preprocess_source(source, folder, chunk_rows)
+  return read_columns(folder, mmap=False), schema['categories']
+
+
+"""##Data Analysis
+Visualising the pre preoessed data and trying to get the intution about different characterstics.
 """
 
-from sklearn.linear_model import LogisticRegressionCV
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import KFold
-from sklearn.model_selection import train_test_split
-from sklearn.naive_bayes import GaussianNB
-from sklearn.linear_model import SGDClassifier
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import make_pipeline
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.datasets import make_classification
-from sklearn import svm
-from sklearn import tree
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.metrics import confusion_matrix
-from sklearn.metrics import roc_auc_score
-from sklearn.model_selection import GridSearchCV
-from sklearn.tree import DecisionTreeClassifier
-import matplotlib.pyplot as plt 
-from sklearn.metrics import log_loss
-from sklearn import tree
-import graphviz
-from sklearn.neural_network import MLPClassifier
-
-"""Shape of Datasets"""
-
-print(X_data.shape)
-print(Y_data.shape)
-
-def ass(y_true,y_pred):
-  tn, fp, fn, tp = confusion_matrix(y_true, y_pred).ravel()
-  accuracy=(tp+tn)/(tp+fp+fn+tn)
-  specificity = tn/(tn+fp)
-  sensitivity=tp/(tp+fn)
-  print("Accuracy:",accuracy*100)
-  print("Sensitivity:",sensitivity*100)
-  print("Specificity:",specificity*100)
-  print("ROC_AUC_Score:",roc_auc_score(y_true, y_pred)*100)
-
-"""Splitting Data into Training Data and Testing Data"""
-
-X_train, X_test, Y_train, Y_test = train_test_split(X_data, Y_data, test_size=0.30, random_state=1)
-
-"""Performing Logistic Regression with Cross Validation Estimator"""
-
-lgc=make_pipeline(LogisticRegressionCV(cv=5,random_state=1,max_iter=5000))
-lgc.fit(X_train, Y_train)
-y_pred=lgc.predict(X_test)
-ass(Y_test,y_pred)
-
-"""Performing Gaussian Naive Bayes """
-
-gnb=make_pipeline(GaussianNB())
-gnb.fit(X_train,Y_train)
-y_pred=gnb.predict(X_test)
-ass(Y_test,y_pred)
-
-"""Finding Optimal Depth (SGD Classifier)"""
-
-mx=-1
-ri=-1
-for i in range(1,10000):
-  sgd= make_pipeline(SGDClassifier(random_state=i))
-  sgd.fit(X_train,Y_train)
-  pmx=mx
-  mx=max(mx,sgd.score(X_test,Y_test))
-  if(pmx!=mx):
-    ri=i
-print(ri)
-
-"""Performing SGD classifier with optimal Depth"""
-
-sgd= make_pipeline(SGDClassifier(random_state=ri))
-sgd.fit(X_train,Y_train)
-y_pred=sgd.predict(X_test)
-ass(Y_test,y_pred)
-
-"""Performing SVM ( Supoort Vector Machine ) classification on the given data"""
-
-SVM_object = make_pipeline(svm.SVC(kernel='linear'))
-SVM_object.fit(X_train,Y_train)
-y_pred=SVM_object.predict(X_test)
-ass(Y_test,y_pred)
-
-"""Performing Decision tree classification
+def summarize(final_data):
+  """Prevalences of the binary features and means of the vital and lab features, split by ICU label (see cohort_summary.py)"""
+  from cohort_summary import summarize as cohort_summary
+  return cohort_summary(final_data, groups={'vital': VITAL_FEATURES, 'lab': LAB_FEATURES})
+
+
+def feature_moments(final_data):
+  """Mergeable means, variances and covariances with ICU of every feature (see feature_stats.py)"""
+  from feature_stats import FeatureMoments
+  return FeatureMoments.from_frame(final_data)
+
+
+def monitor_drift(moments, shard, root=STATS_ROOT):
+  """Stores the moments of this dataset as a shard, prints its drift from the other shards and the
+  selection of the pooled moments. Returns the drift report, None for the first shard.
+  """
+  import warnings
+  from feature_stats import MomentStore, drift_report, reselect
+  store = MomentStore(root)
+  history = None
+  try:                  #a broken store must not stop the training
+    history = store.merged(exclude=[shard], features=moments.features)
+  except (OSError, ValueError, KeyError) as error:
+    warnings.warn("Drift report skipped, the moments of %s are unreadable: %s" % (root, error))
+  try:
+    store.save(shard, moments)
+  except OSError as error:
+    warnings.warn("The moments of this dataset were not stored: %s" % error)
+  if history is None:
+    return None
+  report = drift_report(history, moments)
+  print("Drift from the", history.n, "patients seen before:")
+  print(report[report['drifted']])
+  print("Selected on all the", history.n + moments.n, "patients:", reselect(history.merge(moments)))
+  return report
+
+
+def plot_distributions(summary):
+  import matplotlib.pyplot as plt
+  import numpy as np
+  from cohort_summary import AGE_PERCENTILE_COLUMNS, COMORBIDITY_COLUMNS, cohort_sizes, cohort_table
+
+  ICU_admission_distribution = cohort_sizes(summary)
+  print("Total Patients after pre processing: ", ICU_admission_distribution['all'])
+  print("Distribution of ICU admissions")
+  print("Patients who were not admitted to ICU: ",ICU_admission_distribution['non_icu'])
+  print("Patients who were admitted to ICU: ",ICU_admission_distribution['icu'])
+  labels= ['Admitted to ICU', 'Not Admitted to ICU']
+  colors=['tomato', 'deepskyblue']
+  sizes= [ICU_admission_distribution['icu'], ICU_admission_distribution['non_icu']]
+  plt.pie(sizes,labels=labels, colors=colors, startangle=90, autopct='%1.1f%%')
+  plt.title("ICU Distribution of data")
+  plt.axis('equal')
+  plt.show()
+
+  above65 = cohort_table(summary, ['AGE_ABOVE65'], value='sum').iloc[0]           #patients above 65 in every cohort
+  for cohort, colors, title in [('all', ['lightgreen', 'violet'], "Age Distribution of data"),
+                                ('icu', ['orange', 'cyan'], "Age Distribution of ICU Admitted patients")]:
+    print("Age Distribution")
+    print("Patients below age 65: ",int(ICU_admission_distribution[cohort]-above65[cohort]))
+    print("Patients above age 65: ",int(above65[cohort]))
+    labels= ['Below 65', 'Above 65']
+    sizes= [ICU_admission_distribution[cohort]-above65[cohort], above65[cohort]]
+    plt.pie(sizes,labels=labels, colors=colors, startangle=90, autopct='%1.1f%%')
+    plt.axis('equal')
+    plt.title(title)
+    plt.show()
+
+  #patients with every age percentile and every disease, in total and among the ICU admitted
+  for columns, names, title in [(AGE_PERCENTILE_COLUMNS, [c.replace('Above 90th', 'Above 90') for c in AGE_PERCENTILE_COLUMNS], 'Age Distribution Total and ICU Admitted'),
+                                (COMORBIDITY_COLUMNS, ['Diesease_Grouping_1','Diesease_Grouping_2','Diesease_Grouping_3','Diesease_Grouping_4','Diesease_Grouping_5','Diesease_Grouping_6', 'Hypertension', 'Immunocompromised'], 'Disease Distribution Total and ICU Admitted')]:
+    x = cohort_table(summary, columns, value='sum')[['all', 'icu']]
+    print(x.T)
+    positions = np.arange(len(x))
+    plt.bar(positions, x['all'], width=0.8, label='Total')
+    plt.bar(positions, x['icu'], width=0.8, label='ICU Admitted')
+    plt.xticks(positions, names, rotation = 70)
+    plt.legend()
+    plt.ylabel('Frequency')
+    plt.title(title)
+    plt.show()
+
+
+def plot_correlation(corr, title):
+  """Heatmap of a correlation matrix, clustered and downsampled to report.MAX_CELLS features."""
+  from report import plot_heatmap
+  plot_heatmap(corr, title)
+
+
+def select(final_data, upper=0.11, lower=-0.12, paper=False):
+  """Screens every feature by its correlation with the ICU label, returns the selected names and data.
+
+  paper=True screens only the hand picked features of the paper, to reproduce its model.
+  """
+  from feature_selection import PAPER_FEATURES, target_correlations, select_features
+  ICU_corr = target_correlations(final_data)         #correlation of every feature with the ICU label only
+  print(ICU_corr.describe())
+
+  selection = select_features(final_data, upper = upper, lower = lower, candidates = PAPER_FEATURES if paper else None)
+  print(len(ICU_corr), len(selection))
+  selected_final_data = final_data[selection + ['ICU']]
+  print(selected_final_data.shape)
+  return selection, selected_final_data
+
+
+def plot_group_means(summary):
+  import matplotlib.pyplot as plt
+  import numpy as np
+  from cohort_summary import cohort_table
+
+  for features, ylabel, title in [(VITAL_FEATURES, 'Normalized Values', "Vital Signs of Covid19 Patients"),
+                                  (LAB_FEATURES, 'Normalized Value', "Lab Test Results of Covid19 patients")]:
+    # set width of bar
+    barWidth = 0.25
+    fig = plt.subplots(figsize =(20, 10))
+
+    means = cohort_table(summary, features)
+    group_non_ICU = means['non_icu'].to_numpy()
+    group_ICU = means['icu'].to_numpy()
+
+    # Set position of bar on X axis
+    br1 = np.arange(len(group_ICU)) + (barWidth*0.5)
+    br2 = [x + barWidth for x in br1]
+
+    # Make the plot
+    plt.bar(br2, group_ICU, color ='r', width = barWidth, edgecolor ='grey', label ='ICU Admitted')
+    plt.bar(br1, group_non_ICU, color ='b', width = barWidth, edgecolor ='grey', label ='NOT Admitted')
+
+    plt.xlabel('Features', fontweight ='bold')
+    plt.ylabel(ylabel, fontweight ='bold')
+    plt.xticks([r + barWidth for r in range(len(group_ICU))], features, rotation = 90)
+    plt.legend()
+    plt.title(title)
+    plt.show()
+
+
+def to_arrays(selected_final_data):
+  import numpy as np
+  X_data = selected_final_data.drop(['ICU'], axis = 1).to_numpy(dtype = np.float32)
+  Y_data = selected_final_data['ICU'].to_numpy(dtype = int)
+  print(X_data.shape)
+  print(Y_data.shape)
+  return X_data, Y_data
+
+
+def tsne_embedding(X_data, method='auto', pca=None):
+  """t-SNE of the selected features, read from embeddings.cache when X_data did not change (see embedding.py)"""
+  from embedding import cached_embedding
+  return cached_embedding(X_data, method=method, pca=pca)       #pca=0.80 keeps 80% of the variance before t-SNE
+
+
+def plot_tsne(tsne_data, Y_data):
+  import matplotlib.pyplot as plt
+  import numpy as np
+  import pandas as pd
+  import seaborn as sns
+
+  # creating a new data frame which
+  # help us in ploting the result data
+  tsne_data = np.vstack((tsne_data.T, Y_data)).T
+  tsne_df = pd.DataFrame(data = tsne_data,
+       columns =("Dim_1", "Dim_2","label"))
+
+  # Ploting the result of tsne
+  sns.FacetGrid(tsne_df, hue ="label", height = 6).map(
+         plt.scatter, 'Dim_1', 'Dim_2', s = 100).add_legend()
+  plt.show()
 
+
+"""## Training and Testing using various classifiers
 """
 
-DT_object=tree.DecisionTreeClassifier(criterion='entropy',max_depth=4,max_leaf_nodes=10)
-DT_object.fit(X_train,Y_train)
-y_pred=DT_object.predict(X_test)
-ass(Y_test,y_pred)
+def split(X_data, Y_data):
+  """Splitting Data into Training Data and Testing Data"""
+  from sklearn.model_selection import train_test_split
+  return train_test_split(X_data, Y_data, test_size=0.30, random_state=1)
 
-from sklearn import tree
-import graphviz
-text_representation = tree.export_text(DT_object)
-print(text_representation)
 
-features=['AGE_ABOVE65', 'DISEASE GROUPING 2', 'DISEASE GROUPING 3',
-       'DISEASE GROUPING 4', 'HTN', 'BIC_VENOUS_MEAN', 'CALCIUM_MEAN',
-       'CREATININ_MEAN', 'GLUCOSE_MEAN', 'INR_MEAN', 'LACTATE_MEAN',
-       'LEUKOCYTES_MEAN', 'LINFOCITOS_MEAN', 'NEUTROPHILES_MEAN',
-       'PC02_VENOUS_MEAN', 'PCR_MEAN', 'PLATELETS_MEAN', 'SAT02_VENOUS_MEAN',
-       'SODIUM_MEAN', 'UREA_MEAN', 'BLOODPRESSURE_DIASTOLIC_MEAN',
-       'RESPIRATORY_RATE_MEAN', 'TEMPERATURE_MEAN', 'OXYGEN_SATURATION_MEAN',
-       'BLOODPRESSURE_SISTOLIC_MIN', 'HEART_RATE_MIN', 'RESPIRATORY_RATE_MIN',
-       'TEMPERATURE_MIN', 'BLOODPRESSURE_DIASTOLIC_MAX',
-       'BLOODPRESSURE_SISTOLIC_MAX', 'HEART_RATE_MAX', 'OXYGEN_SATURATION_MAX',
-       'BLOODPRESSURE_DIASTOLIC_DIFF', 'BLOODPRESSURE_SISTOLIC_DIFF',
-       'HEART_RATE_DIFF', 'RESPIRATORY_RATE_DIFF', 'TEMPERATURE_DIFF',
-       'OXYGEN_SATURATION_DIFF', 'AGE_PERCENTIL_10th', 'AGE_PERCENTIL_20th',
-       'AGE_PERCENTIL_80th', 'AGE_PERCENTIL_90th']
-classes=['Non-ICU','ICU']
-dot_data = tree.export_graphviz(DT_object, out_file=None, 
-                                feature_names=features,  
-                                class_names=classes,
-                                filled=True)
-graph = graphviz.Source(dot_data, format="png") 
-graph
-
-"""Performing K-Nearest Neighbour Classifier 
+def split_selection(selected):
+  selection, selected_final_data = selected
+  return split(*to_arrays(selected_final_data))
 
-"""
 
-KNN_object=make_pipeline(KNeighborsClassifier(n_neighbors=25,p=1))
-KNN_object.fit(X_train,Y_train)
-y_pred=KNN_object.predict(X_test)
-ass(Y_test,y_pred)
+def sgd_seeds(split_data, budget=10000, patience=500, cv=5):
+  """Finding the optimal seed of the SGD classifier, seeds scored on CV folds in parallel, stopping when no improvement is seen"""
+  from model_search import make_sgd, seed_search
+  X_train, X_test, Y_train, Y_test = split_data
+  return seed_search(make_sgd, X_train, Y_train, budget=budget, patience=patience, cv=cv)
 
-"""Performing Random Forest Classifier"""
 
-RF_object = RandomForestClassifier(criterion='gini',random_state=23,max_depth=6,bootstrap=True)
-RF_object.fit(X_train,Y_train)
-y_pred=RF_object.predict(X_test)
-ass(Y_test,y_pred)
+def stage_name(model):
+  return 'train-' + model.lower().replace(' ', '-')
 
-"""##Performing Grid Search on Various ML Algorithm
 
-Grid Search on Decision Tree
+def train_zoo(cache, split_data, sgd_seed, zoo_workers=ZOO_WORKERS, rf_jobs=RF_N_JOBS):
+  """Training all the classifiers: Logistic Regression with Cross Validation Estimator, Gaussian Naive Bayes,
+  SGD classifier, linear SVM ( Supoort Vector Machine ), Decision tree, K-Nearest Neighbour, Random Forest
+  and the MLP with every activation function.
+
+  Every model is a train-<model> stage keyed by the split and its parameters. Only
+  the models missing from the cache are trained, concurrently, the Random Forest
+  with up to `rf_jobs` jobs. Returns the cached
+  (row of the comparison table, fitted model) of every model by name.
+  """
+  from artifacts import params_json
+  from model_zoo import fit_and_score, zoo_models, run_zoo
+  from profiling import record, stage
+  X_train, X_test, Y_train, Y_test = split_data.value
+  models = zoo_models(sgd_seed=sgd_seed, rf_jobs=rf_jobs)
+  trained, missing = {}, {}
+  for name, model in models.items():
+    key, cached = cache.lookup(stage_name(name), [split_data], {'params': params_json(model)}, fit_and_score, ['model_zoo'])
+    if cached is None:
+      missing[name] = key
+    else:
+      trained[name] = cached
+  if missing:
+    with stage('train', models=len(missing)):
+      table, fitted = run_zoo(dict((name, models[name]) for name in missing), X_train, Y_train, X_test, Y_test, n_workers=zoo_workers)      #one process per model, training data memory-mapped
+      for name, key in missing.items():
+        row = table.loc[name]
+        record(stage_name(name), row['fit_seconds'], cpu_seconds=row['fit_cpu_seconds'], peak_rss=row['worker_peak_rss_mb'], rows=X_train.shape[0], cols=X_train.shape[1])
+        trained[name] = cache.store(stage_name(name), key, (row.to_dict(), fitted[name]))
+  return dict((name, trained[name]) for name in models)
+
+
+def evaluate_zoo(split_data, *trained, names):
+  """Comparison table of the trained models and the triage operating point of the Random Forest."""
+  import pandas as pd
+  X_train, X_test, Y_train, Y_test = split_data
+  zoo_table = pd.DataFrame([row for row, _ in trained], index=pd.Index(names, name='model'))
+  RF_object = trained[names.index('Random Forest')][1]
+  return zoo_table, triage_point(RF_object, X_test, Y_test)
+
+
+def triage_point(RF_object, X_test, Y_test, min_sensitivity=0.9):
+  """ICU triage operating point of the Random Forest: the threshold with the best specificity that still finds 90% of the ICU admissions"""
+  from metrics import threshold_sweep, operating_point
+  rf_sweep = threshold_sweep(Y_test, RF_object.predict_proba(X_test)[:, 1])
+  return operating_point(rf_sweep, min_sensitivity=min_sensitivity)
+
+
+def save_models(zoo_fitted, selection, state, X_train, Y_train, root=ARTIFACT_ROOT):
+  """Saving every trained model with its feature order and pre-processing state (python3 scoring_server.py artifacts --name random_forest)"""
+  from artifacts import save_artifact
+  versions = {}
+  for name, model in zoo_fitted.items():
+    versions[name] = save_artifact(root, name.lower().replace(' ', '_'), model, selection, state, X_train, Y_train)
+    print(name, versions[name])
+  return versions
+
+
+def show_decision_tree(DT_object, features):
+  import graphviz
+  from sklearn import tree
+  text_representation = tree.export_text(DT_object)
+  print(text_representation)
+
+  classes=['Non-ICU','ICU']
+  dot_data = tree.export_graphviz(DT_object, out_file=None,
+                                  feature_names=features,
+                                  class_names=classes,
+                                  filled=True)
+  return graphviz.Source(dot_data, format="png")
+
+
+"""##Performing Grid Search on Various ML Algorithm
 """
 
-param_grid = {'criterion':['entropy','gini'],'max_depth':np.arange(1,30),'max_leaf_nodes':np.arange(3,20),'random_state':[1,2]}
-GS_DT=GridSearchCV(DecisionTreeClassifier(), param_grid,cv=5)
-GS_DT.fit(X_train,Y_train)
-GS_DT.best_params_
-
-GS_DT.score(X_test,Y_test)
-
-dt_train_score=[]
-dt_test_score=[]
-for i in np.arange(1, 30):
-  param_grid = {'criterion':['entropy','gini'],'max_depth': [i],'max_leaf_nodes':np.arange(3,20),'random_state':[1,2]}
-  GS_DT=GridSearchCV(DecisionTreeClassifier(), param_grid,cv=5)
-  GS_DT.fit(X_train,Y_train)
-  y_train_pred=GS_DT.predict(X_train)
-  y_pred=GS_DT.predict(X_test)
-  dt_train_score.append(log_loss(Y_train,y_train_pred))
-  dt_test_score.append(log_loss(Y_test,y_pred))
-
-plt.title("Decision Tree Classifier : Error vs Depth")
-plt.xlabel("Depth")
-plt.ylabel("Error")
-plt.plot(np.arange(1,30),dt_train_score,label="Training Error")
-plt.plot(np.arange(1,30),dt_test_score,label="Testing Error")
-plt.legend()
-plt.plot()
-
-""" Best kernel Performance using Grid Search"""
-
-param_grid = {'kernel':['linear','poly','sigmoid','rbf'],'gamma':['scale','auto'],'random_state':[1,2,3]}
-GS_SVM=GridSearchCV(svm.SVC(), param_grid,cv=5)
-GS_SVM.fit(X_train,Y_train)
-GS_SVM.best_params_
-
-GS_SVM.score(X_test,Y_test)
-
-dt_train_score=[]
-dt_test_score=[]
-for i in ['linear','poly','sigmoid','rbf']:
-  param_grid = {'kernel':[i],'gamma':['scale','auto'],'random_state':[1,2,3]}
-  GS_SVM=GridSearchCV(svm.SVC(), param_grid,cv=5)
-  GS_SVM.fit(X_train,Y_train)
-  y_train_pred=GS_SVM.predict(X_train)
-  y_pred=GS_SVM.predict(X_test)
-  dt_train_score.append(log_loss(Y_train,y_train_pred))
-  dt_test_score.append(log_loss(Y_test,y_pred))
-
-plt.title("SVM: Error vs kernel")
-plt.xlabel("Kernel")
-plt.ylabel("Error")
-plt.plot(['linear','poly','sigmoid','rbf'],dt_train_score,label="Training Error")
-plt.plot(['linear','poly','sigmoid','rbf'],dt_test_score,label="Testing Error")
-plt.legend()
-plt.plot()
-
-"""Grid Search on K nearest neighbour"""
-
-param_grid = {'n_neighbors':[10,15,20,25,30,35,40],'leaf_size':np.arange(3,20),'p':[1,2]}
-GS_KNN=GridSearchCV(KNeighborsClassifier(), param_grid,cv=5)
-GS_KNN.fit(X_train,Y_train)
-GS_KNN.best_params_
-
-GS_KNN.score(X_test,Y_test)
-
-knn_train_score=[]
-knn_test_score=[]
-for i in [10,15,20,25,30,35,40]:
-  param_grid = {'n_neighbors': [i],'leaf_size':np.arange(3,20),'p':[1,2]}
-  GS_KNN=GridSearchCV(KNeighborsClassifier(), param_grid,cv=5)
-  GS_KNN.fit(X_train,Y_train)
-  y_train_pred=GS_KNN.predict(X_train)
-  y_pred=GS_KNN.predict(X_test)
-  knn_train_score.append(log_loss(Y_train,y_train_pred))
-  knn_test_score.append(log_loss(Y_test,y_pred))
-
-plt.title("K-Neighbours Classifier: Error vs Number of Neighbors ")
-plt.xlabel("Number of Neighbors")
-plt.ylabel("Error")
-plt.plot([10,15,20,25,30,35,40],knn_train_score,label="Training Error")
-plt.plot([10,15,20,25,30,35,40],knn_test_score,label="Testing Error")
-plt.legend()
-plt.plot()
-
-"""Grid search on Random Forest Classifier"""
-
-param_grid = {'criterion':['gini','entropy'],'max_depth': [6],'random_state':[23]}
-GS_RF=GridSearchCV(RandomForestClassifier(), param_grid,cv=5)
-GS_RF.fit(X_train,Y_train)
-GS_RF.best_params_
-
-GS_RF.score(X_test,Y_test)
-
-rf_train_score=[]
-rf_test_score=[]
-for i in np.arange(1, 30):
-  param_grid = {'criterion':['gini','entropy'],'max_depth': [i],'random_state':[23]}
-  GS_RF=GridSearchCV(RandomForestClassifier(), param_grid,cv=5)
-  GS_RF.fit(X_train,Y_train)
-  y_train_pred=GS_RF.predict(X_train)
-  y_pred=GS_RF.predict(X_test)
-  rf_train_score.append(log_loss(Y_train,y_train_pred))
-  rf_test_score.append(log_loss(Y_test,y_pred))
-
-plt.title("Random Forest Classifier : Error vs Max Depth")
-plt.xlabel("Max Depth")
-plt.ylabel("Error")
-plt.plot(np.arange(1,30),rf_train_score,label="Training Error")
-plt.plot(np.arange(1,30),rf_test_score,label="Testing Error")
-plt.legend()
-plt.plot()
-
-"""Training model with different activation functions and finding model with best accuracy"""
-
-best=1
-acc=-1
-for a in ["identity", "logistic", "tanh", "relu"]:
-    model = MLPClassifier(activation=a,max_iter=10000, batch_size=64,alpha=0.1,random_state=1).fit(X_train,Y_train)
-    y_pred = model.predict(X_test)
-    print(a)
-    ass(Y_test,y_pred)
-    score = model.score(X_test,Y_test)
-    if score>acc:
-      acc=score
-      best = a
-    #print(a," - ",model.score(X_test,Y_test))
-print(best,acc)
-
-"""Performing Grid search on the model we got from the above"""
-
-rf_train_score=[]
-rf_test_score=[]
-a=[0.001,0.01,0.1]
-for i in range(len(a)):
-  param_grid = {'activation':[best],'max_iter': [10000],'batch_size':[64],'alpha':[0.1],'learning_rate_init':[a[i]],'random_state':[1]}
-  GS=GridSearchCV(MLPClassifier(), param_grid)
-  GS.fit(X_train,Y_train)
-  y_train_pred=GS.predict(X_train)
-  y_pred=GS.predict(X_test)
-  rf_train_score.append(log_loss(Y_train,y_train_pred))
-  rf_test_score.append(log_loss(Y_test,y_pred))
-
-plt.title(" MLPClassifier Error vs Learning rate")
-plt.xlabel("Learning rate")
-plt.ylabel("Error")
-plt.plot([0.001,0.01,0.1],rf_train_score,label="Training Error")
-plt.plot([0.001,0.01,0.1],rf_test_score,label="Testing Error")
-plt.legend()
-plt.plot()
\ No newline at end of file
+def plot_error_curve(title, xlabel, values, curve):
+  import matplotlib.pyplot as plt
+  plt.title(title)
+  plt.xlabel(xlabel)
+  plt.ylabel("Error")
+  plt.plot(values,curve['train_error'],label="Training Error")
+  plt.plot(values,curve['test_error'],label="Testing Error")
+  plt.legend()
+  plt.show()
+
+
+def grid_searches(X_train, X_test, Y_train, Y_test, zoo_table, mode=SEARCH_MODE, collapse=False, rf_jobs=RF_N_JOBS, report=None):
+  """Grid searches of the decision tree, SVM, KNN, Random Forest and MLP, with their error curves added to `report`."""
+  import numpy as np
+  from sklearn import svm
+  from sklearn.ensemble import RandomForestClassifier
+  from sklearn.neural_network import MLPClassifier
+  from sklearn.tree import DecisionTreeClassifier
+  from forest import depth_curve, size_curve
+  from model_search import sweep_curves, grid_fits, search
+  from model_zoo import MLP_ACTIVATIONS
+  from neighbors import KNNSearch
+  from profiling import stage
+
+  #Grid Search on Decision Tree
+  with stage('search-decision-tree'):
+    param_grid = {'criterion':['entropy','gini'],'max_depth':np.arange(1,30),'max_leaf_nodes':np.arange(3,20),'random_state':[1,2]}
+    GS_DT=search(DecisionTreeClassifier(), param_grid, X_train, Y_train, mode=mode, collapse=collapse)
+    print(GS_DT.best_params_, GS_DT.score(X_test,Y_test))
+    dt_curve = sweep_curves(GS_DT, 'max_depth', X_train, Y_train, X_test, Y_test)     #errors per depth derived from the grid above
+    print("Fits:", grid_fits(GS_DT, dt_curve), "instead of", 2*grid_fits(GS_DT)-1+29)
+  if report:
+    report.add('error-decision-tree', plot_error_curve, "Decision Tree Classifier : Error vs Depth", "Depth", dt_curve['max_depth'], dt_curve)
+
+  #Best kernel Performance using Grid Search
+  with stage('search-svm'):
+    param_grid = {'kernel':['linear','poly','sigmoid','rbf'],'gamma':['scale','auto'],'random_state':[1,2,3]}
+    GS_SVM=search(svm.SVC(), param_grid, X_train, Y_train, mode=mode, collapse=collapse)
+    print(GS_SVM.best_params_, GS_SVM.score(X_test,Y_test))
+    svm_curve = sweep_curves(GS_SVM, 'kernel', X_train, Y_train, X_test, Y_test)
+    print("Fits:", grid_fits(GS_SVM, svm_curve), "instead of", 2*grid_fits(GS_SVM)-1+4)
+  if report:
+    report.add('error-svm', plot_error_curve, "SVM: Error vs kernel", "Kernel", svm_curve['kernel'], svm_curve)
+
+  #Grid Search on K nearest neighbour
+  with stage('search-knn'):
+    GS_KNN=KNNSearch(n_neighbors=[10,15,20,25,30,35,40], p=[1,2], cv=5)          #neighbours sorted once per fold and p, leaf_size does not change the predictions
+    GS_KNN.fit(X_train,Y_train)
+    print(GS_KNN.best_params_, GS_KNN.score(X_test,Y_test))
+    knn_curve = sweep_curves(GS_KNN, 'n_neighbors', X_train, Y_train, X_test, Y_test)
+    print("Neighbour index builds:", GS_KNN.n_index_builds_+len(knn_curve), "instead of", len(GS_KNN.cv_results_['params'])*GS_KNN.n_splits_+1+len(knn_curve), "KNN fits of GridSearchCV")
+  if report:
+    report.add('error-knn', plot_error_curve, "K-Neighbours Classifier: Error vs Number of Neighbors ", "Number of Neighbors", knn_curve['n_neighbors'], knn_curve)
+
+  #Grid search on Random Forest Classifier
+  with stage('search-random-forest'):
+    param_grid = {'criterion':['gini','entropy'],'max_depth': [6],'random_state':[23]}
+    GS_RF=search(RandomForestClassifier(), param_grid, X_train, Y_train, mode=mode, collapse=collapse)
+    print(GS_RF.best_params_, GS_RF.score(X_test,Y_test))
+    rf_curve = depth_curve(X_train, Y_train, X_test, Y_test, depths=np.arange(1,30), criteria=['gini','entropy'], random_state=23, n_jobs=rf_jobs)     #forests grown once per fold to depth 29, shallower depths read off by truncation
+    print("Forests trained:", rf_curve.attrs['fits'], "instead of", 29*(2*5+1))
+    rf_size_curve = size_curve(X_train, Y_train, X_test, Y_test, criterion=GS_RF.best_params_['criterion'], max_depth=6,
+                               random_state=23, n_jobs=rf_jobs)       #trees added to the same forest with warm_start
+    print("Trees trained:", rf_size_curve.attrs['trees'], "instead of", rf_size_curve['n_estimators'].sum())
+  if report:
+    report.add('error-random-forest', plot_error_curve, "Random Forest Classifier : Error vs Max Depth", "Max Depth", rf_curve['max_depth'], rf_curve)
+    report.add('error-random-forest-size', plot_error_curve, "Random Forest Classifier : Error vs Number of Trees", "Number of Trees", rf_size_curve['n_estimators'], rf_size_curve)
+
+  #Activation function of the MLP with the best accuracy, the MLPs were trained with the rest of the zoo
+  mlp_table = zoo_table.loc[['MLP ' + a for a in MLP_ACTIVATIONS]]
+  print(mlp_table)
+  best = mlp_table['accuracy'].idxmax()[len('MLP '):]
+  print(best, mlp_table['accuracy'].max())
+
+  #Performing Grid search on the model we got from the above
+  with stage('search-mlp'):
+    param_grid = {'activation':[best],'max_iter': [10000],'batch_size':[64],'alpha':[0.1],'learning_rate_init':[0.001,0.01,0.1],'random_state':[1]}
+    GS=search(MLPClassifier(), param_grid, X_train, Y_train, mode=mode)
+    mlp_curve = sweep_curves(GS, 'learning_rate_init', X_train, Y_train, X_test, Y_test)
+  if report:
+    report.add('error-mlp', plot_error_curve, " MLPClassifier Error vs Learning rate", "Learning rate", mlp_curve['learning_rate_init'], mlp_curve)
+
+  return {'Decision Tree': GS_DT, 'SVM': GS_SVM, 'KNN': GS_KNN, 'Random Forest': GS_RF, 'MLP': GS}
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description='Predicting ICU admission of confirmed COVID-19 cases')
+  parser.add_argument('--data', default=DATASET_FILE, help='Sirio-Libanes workbook, downloaded when missing')
+  parser.add_argument('--search-mode', default=SEARCH_MODE, choices=['grid', 'halving'])
+  parser.add_argument('--collapse-dead-parameters', action='store_true', help='pin grid parameters that do not change the predictions')
+  parser.add_argument('--rf-jobs', type=int, default=RF_N_JOBS, help='parallel jobs of the random forests')
+  parser.add_argument('--zoo-workers', type=int, default=ZOO_WORKERS, help='worker processes training the model zoo')
+  parser.add_argument('--artifacts', default=ARTIFACT_ROOT, help='artifact store of the trained models')
+  parser.add_argument('--cache', default=STAGE_CACHE, help='folder of the stage cache')
+  parser.add_argument('--cache-mb', type=int, default=STAGE_CACHE_MB, help='size budget of the stage cache')
+  parser.add_argument('--chunk-rows', type=int, help='pre-process the source in chunks of this many rows, for sources larger than memory (.csv, or .xlsx streamed row by row)')
+  parser.add_argument('--no-cache', action='store_true', help='recompute every stage and store nothing')
+  parser.add_argument('--force', action='append', default=[], metavar='STAGE',
+                      help='recompute a stage even when cached, e.g. impute, train-random-forest, train-* or all, repeatable')
+  parser.add_argument('--trace', help='write the per-stage timing and memory trace to this .json, .csv or .folded file')
+  parser.add_argument('--flame', action='store_true', help='print the stage tree with wall time bars at the end')
+  parser.add_argument('--paper-features', action='store_true', help='select among the hand picked features of the paper only, to reproduce it')
+  parser.add_argument('--stats', default=STATS_ROOT, help='folder of the feature moments of every dataset, for the drift report')
+  parser.add_argument('--no-plots', action='store_true', help='skip every figure and the report')
+  parser.add_argument('--report', default=REPORT_ROOT, help='folder of the run reports, one sub-folder per run')
+  parser.add_argument('--report-workers', type=int, help='worker processes rendering the figures, all cores by default')
+  parser.add_argument('--full-correlation', action='store_true', help='add the heatmap of all the columns, clustered and downsampled')
+  parser.add_argument('--tsne-method', default='auto', choices=['auto', 'exact', 'barnes_hut'],
+                      help='auto is exact up to 200 patients and Barnes-Hut above')
+  parser.add_argument('--tsne-pca', type=lambda v: v if v == 'auto' else float(v) if '.' in v else int(v),
+                      help='PCA before t-SNE: components (int), variance kept (float) or auto')
+  parser.add_argument('--skip-search', action='store_true', help='skip the grid searches and error curves')
+  return parser.parse_args(argv)
+
+
+def main(argv=None):
+  from profiling import PROFILER, stage
+  args = parse_args(argv)
+  with stage('pipeline'):
+    run_pipeline(args)
+  if args.trace:
+    PROFILER.write(args.trace)
+  if args.flame:
+    print(PROFILER.summary())
+
+
+def run_pipeline(args):
+  from data_loading import download_dataset, source_hash
+  from model_search import best_seed
+  from preprocessing import preprocessing_state
+  from profiling import stage
+  from report import Report, run_folder
+  from stage_cache import Cached, StageCache
+  cache = StageCache(args.cache, args.cache_mb << 20, force=args.force, enabled=not args.no_cache)
+
+  #load -> encode -> propagate -> impute -> select -> split -> train-<model> -> evaluate, each stage skipped when cached
+  source = download_dataset(args.data)
+  if args.chunk_rows:
+    chunked = cache.run('chunked', preprocess_chunked, Cached(source_hash(source, first_windows_folder(source)), source), chunk_rows=args.chunk_rows)
+    final_data = Cached(chunked.key, chunked.value[0])
+    state = preprocessing_state(None, categories=chunked.value[1])
+  else:
+    data = cache.run('load', load_data, Cached(source_hash(source), source))      #hashed again only when the size or mtime changed
+    data_expand = cache.run('encode', encode, data)
+    df = cache.run('propagate', propagate, data_expand)
+    final_data = cache.run('impute', impute, df)
+    state = preprocessing_state(data.value)
+  print(final_data.value.describe())
+  summary = cache.run('summary', summarize, final_data).value
+  moments = cache.run('moments', feature_moments, final_data)
+  with stage('drift'):
+    monitor_drift(moments.value, final_data.key[:16], args.stats)
+  report = None if args.no_plots else Report(run_folder(args.report, final_data.key[:8]), workers=args.report_workers)
+  if report:
+    report.add('distributions', plot_distributions, summary)
+    if args.full_correlation:           #the full feature x feature matrix is only needed for this heatmap
+      with stage('full-correlation'):
+        report.add('full-correlation', plot_correlation, final_data.value.corr(), 'Correlation of all the features')
+
+  selected = cache.run('select', select, final_data, upper=0.11, lower=-0.12, paper=args.paper_features)
+  selection, selected_final_data = selected.value
+  if report:
+    report.add('correlation', plot_correlation, selected_final_data.corr(), 'Correlation of the selected features')
+    report.add('group-means', plot_group_means, summary)
+    X_data, Y_data = to_arrays(selected_final_data)
+    with stage('tsne') as event:
+      tsne_data = event.output(tsne_embedding(X_data, args.tsne_method, args.tsne_pca))
+    report.add('tsne', plot_tsne, tsne_data, Y_data)
+
+  split_data = cache.run('split', split_selection, selected)
+  X_train, X_test, Y_train, Y_test = split_data.value
+  seed_table = cache.run('seed-search', sgd_seeds, split_data).value
+  print(seed_table)
+  print("Fits:", seed_table.attrs['fits'], "Mean seconds per fit:", seed_table['fit_seconds'].mean())
+  ri = best_seed(seed_table)
+  print(ri)
+
+  trained = train_zoo(cache, split_data, ri, args.zoo_workers, args.rf_jobs)
+  zoo_table, point = cache.run('evaluate', evaluate_zoo, split_data, *trained.values(), names=list(trained)).value
+  print(zoo_table)
+  print(point)
+  zoo_fitted = dict((name, result.value[1]) for name, result in trained.items())
+  with stage('save'):
+    save_models(zoo_fitted, selection, state, X_train, Y_train, args.artifacts)
+  print("Stages from the cache:", cache.hits)
+  print("Stages computed:", cache.misses)
+  if report:
+    report.add_table('Model zoo', zoo_table)
+    report.add_image('decision-tree', show_decision_tree(zoo_fitted['Decision Tree'], selection).render(os.path.join(report.folder, 'decision_tree'), cleanup=True))
+
+  if not args.skip_search:
+    grid_searches(X_train, X_test, Y_train, Y_test, zoo_table, args.search_mode, args.collapse_dead_parameters, args.rf_jobs, report)
+  if report:
+    with stage('report'):
+      print("Report:", report.close())
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Loading of the Sirio-Libanes dataset through a columnar on-disk cache.
+
+The workbook is parsed only once. Every column is then stored as its own `.npy`
+file next to a `schema.json` sidecar, and later loads memory-map just the columns
+that are asked for. The cache is rebuilt whenever the hash of the workbook changes.
+"""
+
+import hashlib
+import json
+import os
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+DATASET_URL = "https://drive.google.com/uc?export=download&id=1_shaH6SQajy1zrnALzim9jGaRmF3PLIn"
+DATASET_FILE = "Kaggle_Sirio_Libanes_ICU_Prediction.xlsx"
+SCHEMA_FILE = "schema.json"
+
+KEY_COLUMNS = ['PATIENT_VISIT_IDENTIFIER', 'WINDOW', 'ICU']     #always loaded, the pre-processing needs them
+
+
+def download_dataset(path=DATASET_FILE, url=DATASET_URL):
+  """Downloads the workbook unless it is already present and returns its path."""
+  if not os.path.exists(path):
+    urllib.request.urlretrieve(url, path)
+  return path
+
+
+def file_hash(path, chunk_size=1 << 20):
+  """SHA-256 of a file, read in chunks."""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as f:
+    for chunk in iter(lambda: f.read(chunk_size), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def default_cache_dir(source):
+  return os.path.splitext(source)[0] + '.cache'
+
+
+def read_schema(cache_dir):
+  path = os.path.join(cache_dir, SCHEMA_FILE)
+  if not os.path.exists(path):
+    return None
+  with open(path) as f:
+    return json.load(f)
+
+
+def write_schema(cache_dir, schema):
+  path = os.path.join(cache_dir, SCHEMA_FILE)
+  with open(path + '.tmp', 'w') as f:
+    json.dump(schema, f, indent=1)
+  os.replace(path + '.tmp', path)
+
+
+def cache_is_fresh(source, schema, cache_dir=None):
+  """The size and mtime of the workbook are checked first so the hash is only computed when they differ.
+
+  When only they changed (e.g. the file was copied or touched) the new ones are
+  written to the schema in `cache_dir`, so the next check is fast again.
+  """
+  if schema is None:
+    return False
+  stat = os.stat(source)
+  if schema['source_size'] == stat.st_size and schema['source_mtime'] == stat.st_mtime:
+    return True
+  if schema['source_hash'] != file_hash(source):
+    return False
+  if cache_dir is not None:
+    schema['source_size'], schema['source_mtime'] = stat.st_size, stat.st_mtime
+    write_schema(cache_dir, schema)
+  return True
+
+
+def source_fields(source):
+  """Hash, size and mtime of the source, as stored in a schema for cache_is_fresh."""
+  stat = os.stat(source)
+  return {'source_hash': file_hash(source), 'source_size': stat.st_size, 'source_mtime': stat.st_mtime}
+
+
+def source_hash(source, cache_dir=None):
+  """Content hash of the source, taken from the schema in `cache_dir` while cache_is_fresh holds,
+  so the source is only hashed again when its size or mtime changed.
+  """
+  cache_dir = cache_dir or default_cache_dir(source)
+  schema = read_schema(cache_dir)
+  if cache_is_fresh(source, schema, cache_dir):
+    return schema['source_hash']
+  return file_hash(source)
+
+
+def build_cache(source, cache_dir=None):
+  """Parses the workbook and writes one `.npy` file per column plus the schema sidecar.
+
+  Text columns are stored as integer codes, their categories go to the schema.
+  """
+  cache_dir = cache_dir or default_cache_dir(source)
+  os.makedirs(cache_dir, exist_ok=True)
+  data = pd.read_excel(source)
+  columns = []
+  for i, name in enumerate(data.columns):
+    entry = {'name': name, 'file': '%04d.npy' % i}
+    values = data[name]
+    if not pd.api.types.is_numeric_dtype(values):
+      codes, categories = pd.factorize(values)
+      entry['categories'] = [str(c) for c in categories]
+      values = codes.astype(np.int16)
+    else:
+      values = values.to_numpy()
+    entry['dtype'] = str(values.dtype)
+    np.save(os.path.join(cache_dir, entry['file']), values)
+    columns.append(entry)
+
+  schema = dict(source_fields(source), rows=len(data), columns=columns)
+  write_schema(cache_dir, schema)         #written last, a half written cache is never seen as valid
+  return schema
+
+
+def source_columns(names, schema):
+  """Maps column names, including hotcoded ones like AGE_PERCENTIL_10th, back to the workbook columns."""
+  entries = {c['name']: c for c in schema['columns']}
+  wanted = list(KEY_COLUMNS)
+  for name in names:
+    if name not in entries:
+      name = next((c['name'] for c in schema['columns']
+                   if 'categories' in c and name.startswith(c['name'] + '_')
+                   and name[len(c['name'])+1:] in c['categories']), None)
+      if name is None:
+        continue                      #derived column that has no source, e.g. created later in the pipeline
+    if name not in wanted:
+      wanted.append(name)
+  return wanted
+
+
+def load_dataset(source=DATASET_FILE, columns=None, cache_dir=None, mmap=True):
+  """Loads the dataset from the columnar cache, building it first if it is missing or stale.
+
+  `columns` restricts the load to the given (source or hotcoded) column names,
+  the patient id, window and ICU columns are always included. Columns keep the
+  order of the workbook.
+  """
+  cache_dir = cache_dir or default_cache_dir(source)
+  schema = read_schema(cache_dir)
+  if not cache_is_fresh(source, schema, cache_dir):
+    schema = build_cache(source, cache_dir)
+
+  wanted = None if columns is None else set(source_columns(columns, schema))
+  mmap_mode = 'r' if mmap else None
+  loaded = {}
+  for entry in schema['columns']:
+    if wanted is not None and entry['name'] not in wanted:
+      continue
+    values = np.load(os.path.join(cache_dir, entry['file']), mmap_mode=mmap_mode)
+    if 'categories' in entry:
+      categories = np.array(entry['categories'], dtype=object)
+      values = np.where(values >= 0, categories[np.maximum(values, 0)], np.nan)    #code -1 is a missing text value
+    loaded[entry['name']] = values
+  return pd.DataFrame(loaded, copy=False)
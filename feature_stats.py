@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""Mergeable running statistics of the pre-processed features, for drift monitoring.
+
+FeatureMoments keeps, for every feature x and the ICU label y:
+
+    n             patients seen
+    mean, m2      mean of x and sum of squared deviations from it (Welford)
+    y_mean, y_m2  the same for y
+    cxy           sum of the co-deviations of x and y
+    class_n       patients per label (non ICU, ICU)
+    class_mean    mean of x per label
+
+A batch of patients is summarized with numpy and merged in with the pairwise
+update of Chan et al., so updating with new patients, or merging the moments of
+two hospitals or shards, costs O(features) and gives the moments of the pooled
+patients. Correlations with y, the selection of feature_selection.screen and
+the drift between two sets of moments are then computed in O(features) without
+reading any row again.
+
+Moments are stored as JSON, one file per shard of data in a MomentStore:
+
+    python3 feature_stats.py merge shard_a.json shard_b.json -o hospitals.json
+    python3 feature_stats.py drift reference.json current.json
+"""
+
+import argparse
+import json
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from feature_selection import UPPER_THRESHOLD, LOWER_THRESHOLD, screen
+from preprocessing import LABEL_COLUMN
+
+STATS_ROOT = 'feature_stats'
+DRIFT_THRESHOLD = 0.2          #flag a feature whose mean moved by this many pooled standard deviations
+
+
+class FeatureMoments:
+  """Welford moments of every feature and of its covariance with the label, see the module docstring."""
+
+  def __init__(self, features):
+    self.features = list(features)
+    self.n = 0
+    self.y_mean = self.y_m2 = 0.0
+    self.mean = np.zeros(len(self.features))
+    self.m2 = np.zeros(len(self.features))
+    self.cxy = np.zeros(len(self.features))
+    self.class_n = np.zeros(2, dtype=np.int64)
+    self.class_mean = np.zeros((2, len(self.features)))
+
+  @classmethod
+  def from_frame(cls, frame, label_column=LABEL_COLUMN):
+    return cls([name for name in frame.columns if name != label_column]).update(frame, label_column)
+
+  def update(self, frame, label_column=LABEL_COLUMN):
+    """Adds the patients of a pre-processed frame, returns self."""
+    x = frame[self.features].to_numpy(dtype=np.float64)
+    y = frame[label_column].to_numpy(dtype=np.float64)
+    if not len(y):
+      return self
+    batch = FeatureMoments(self.features)
+    batch.n = len(y)
+    batch.mean = x.mean(axis=0)
+    batch.y_mean = y.mean()
+    dx = x - batch.mean
+    dy = y - batch.y_mean
+    batch.m2 = (dx*dx).sum(axis=0)
+    batch.y_m2 = dy @ dy
+    batch.cxy = dy @ dx
+    for label in (0, 1):
+      rows = y == label
+      batch.class_n[label] = rows.sum()
+      if rows.any():
+        batch.class_mean[label] = x[rows].mean(axis=0)
+    return self.merge(batch)
+
+  def merge(self, other):
+    """Pools the patients of `other` into these moments (Chan et al.), returns self."""
+    if other.features != self.features:
+      raise ValueError("Moments of different features cannot be merged")
+    if not other.n:
+      return self
+    n = self.n + other.n
+    w = other.n/n
+    dx = other.mean - self.mean
+    dy = other.y_mean - self.y_mean
+    c = self.n*w                                    #self.n*other.n/n
+    self.m2 = self.m2 + other.m2 + dx*dx*c
+    self.y_m2 = self.y_m2 + other.y_m2 + dy*dy*c
+    self.cxy = self.cxy + other.cxy + dx*dy*c
+    self.mean = self.mean + dx*w
+    self.y_mean = self.y_mean + dy*w
+    class_n = self.class_n + other.class_n
+    with np.errstate(divide='ignore', invalid='ignore'):
+      share = np.where(class_n > 0, other.class_n/class_n, 0)[:, None]
+    self.class_mean = self.class_mean + (other.class_mean - self.class_mean)*share
+    self.class_n = class_n
+    self.n = n
+    return self
+
+  def variance(self):
+    return pd.Series(self.m2/max(self.n - 1, 1), index=self.features)
+
+  def correlations(self):
+    """Pearson correlation of every feature with the label, NaN for the constant ones as in target_correlations."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+      corr = self.cxy/np.sqrt(self.m2*self.y_m2)
+    corr[self.m2 <= 0] = np.nan
+    return pd.Series(corr, index=self.features)
+
+  def class_means(self):
+    """Mean of every feature (rows) for the non ICU and ICU patients (columns), as cohort_summary names them."""
+    return pd.DataFrame(self.class_mean.T, index=self.features, columns=['non_icu', 'icu'])
+
+  def to_dict(self):
+    return {'features': self.features, 'n': self.n, 'y_mean': self.y_mean, 'y_m2': self.y_m2,
+            'mean': self.mean.tolist(), 'm2': self.m2.tolist(), 'cxy': self.cxy.tolist(),
+            'class_n': self.class_n.tolist(), 'class_mean': self.class_mean.tolist()}
+
+  @classmethod
+  def from_dict(cls, state):
+    moments = cls(state['features'])
+    moments.n, moments.y_mean, moments.y_m2 = state['n'], state['y_mean'], state['y_m2']
+    moments.mean, moments.m2, moments.cxy = (np.array(state[k], dtype=np.float64) for k in ('mean', 'm2', 'cxy'))
+    moments.class_n = np.array(state['class_n'], dtype=np.int64)
+    moments.class_mean = np.array(state['class_mean'], dtype=np.float64).reshape(2, len(moments.features))
+    return moments
+
+  def save(self, path):
+    with open(path + '.tmp', 'w') as f:
+      json.dump(self.to_dict(), f)
+    os.replace(path + '.tmp', path)
+
+  @classmethod
+  def load(cls, path):
+    with open(path) as f:
+      return cls.from_dict(json.load(f))
+
+
+def merge_all(moments):
+  """Pooled moments of an iterable of FeatureMoments, None when it is empty."""
+  total = None
+  for m in moments:
+    total = FeatureMoments.from_dict(m.to_dict()) if total is None else total.merge(m)
+  return total
+
+
+def reselect(moments, upper=UPPER_THRESHOLD, lower=LOWER_THRESHOLD, candidates=None):
+  """select_features on the patients behind `moments`, from their correlations only."""
+  return screen(moments.correlations(), upper, lower, candidates)
+
+
+def drift_report(reference, current, upper=UPPER_THRESHOLD, lower=LOWER_THRESHOLD, candidates=None):
+  """Per feature: the means and correlations with ICU of both sets of moments, the shift of the mean in
+  pooled standard deviations, and whether the feature is selected in each.
+
+  `drifted` flags shifts above DRIFT_THRESHOLD and features that enter or leave the selection.
+  """
+  if reference.features != current.features:
+    raise ValueError("Moments of different features cannot be compared")
+  ref_corr, cur_corr = reference.correlations(), current.correlations()
+  pooled = np.sqrt((reference.m2 + current.m2)/max(reference.n + current.n - 2, 1))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    shift = np.where(pooled > 0, (current.mean - reference.mean)/pooled, 0)
+  ref_selected = set(screen(ref_corr, upper, lower, candidates))
+  cur_selected = set(screen(cur_corr, upper, lower, candidates))
+  report = pd.DataFrame({'reference_mean': reference.mean, 'current_mean': current.mean, 'shift_sd': shift,
+                         'reference_corr': ref_corr.to_numpy(), 'current_corr': cur_corr.to_numpy(),
+                         'corr_change': (cur_corr - ref_corr).to_numpy(),
+                         'reference_selected': [name in ref_selected for name in reference.features],
+                         'current_selected': [name in cur_selected for name in reference.features]},
+                        index=pd.Index(reference.features, name='feature'))
+  report['drifted'] = (np.abs(report['shift_sd']) > DRIFT_THRESHOLD) | (report['reference_selected'] != report['current_selected'])
+  return report.sort_values('shift_sd', key=np.abs, ascending=False)
+
+
+class MomentStore:
+  """Folder of the moments of every shard of data, `<root>/<shard>.json`.
+
+  Saving a shard again replaces it, so re-running the pipeline on the same data
+  does not count its patients twice.
+  """
+
+  def __init__(self, root=STATS_ROOT):
+    self.root = root
+
+  def path(self, shard):
+    return os.path.join(self.root, shard + '.json')
+
+  def shards(self):
+    if not os.path.isdir(self.root):
+      return []
+    return sorted(name[:-len('.json')] for name in os.listdir(self.root) if name.endswith('.json'))
+
+  def save(self, shard, moments):
+    os.makedirs(self.root, exist_ok=True)
+    moments.save(self.path(shard))
+
+  def load(self, shard):
+    return FeatureMoments.load(self.path(shard))
+
+  def merged(self, exclude=(), features=None):
+    """Pooled moments of every shard but `exclude`, None when there are none.
+
+    Only the shards with the given features (by default those of the first shard)
+    are pooled, the others, e.g. hotcoded from other categories, are skipped with a warning.
+    """
+    moments, skipped = [], []
+    for shard in self.shards():
+      if shard in exclude:
+        continue
+      m = self.load(shard)
+      if features is None:
+        features = m.features
+      if m.features == list(features):
+        moments.append(m)
+      else:
+        skipped.append(shard)
+    if skipped:
+      warnings.warn("Skipped the moments of other features in %s: %s" % (self.root, ', '.join(skipped)))
+    return merge_all(moments)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Merge feature moments and report the drift between two sets of them')
+  commands = parser.add_subparsers(dest='command', required=True)
+  merge = commands.add_parser('merge', help='pool the moments of several shards')
+  merge.add_argument('inputs', nargs='+', help='moments .json files, or MomentStore folders')
+  merge.add_argument('-o', '--output', required=True)
+  drift = commands.add_parser('drift', help='drift of the current moments from the reference ones')
+  drift.add_argument('reference', help='moments .json file or MomentStore folder')
+  drift.add_argument('current', help='moments .json file or MomentStore folder')
+  drift.add_argument('--all', action='store_true', help='list every feature, not only the drifted ones')
+  args = parser.parse_args(argv)
+
+  def load(path):
+    return MomentStore(path).merged() if os.path.isdir(path) else FeatureMoments.load(path)
+
+  if args.command == 'merge':
+    total = merge_all(load(path) for path in args.inputs)
+    total.save(args.output)
+    print("Merged", total.n, "patients into", args.output)
+    print("Selected:", reselect(total))
+    return
+  reference, current = load(args.reference), load(args.current)
+  report = drift_report(reference, current)
+  print(report if args.all else report[report['drifted']])
+  print("Selected:", reselect(current))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Incremental feature store for windows that arrive one at a time.
+
+Every visit keeps its first window, the running sums and counts of the non NaN
+values of every column and whether the patient was already admitted to the
+ICU. Adding a window or reading the imputed window 0-2 of a visit costs
+O(columns), and gives the same row impute_first_window would give after
+propagate_icu_labels on all the windows seen so far.
+
+The windows of a visit must arrive in order, from WINDOW 0-2 to ABOVE_12: a
+window that is not later than the last one of its visit is rejected, since the
+label truncation depends on the order. scoring_server.py feeds the store from
+its /windows endpoint.
+
+A long-lived store holds at most `max_visits` visits: the visit updated the
+longest time ago is evicted first, and discharge() drops a visit at once.
+"""
+
+import collections
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import ID_COLUMN, LABEL_COLUMN
+
+WINDOW_COLUMN = 'WINDOW'
+WINDOWS = ['0-2', '2-4', '4-6', '6-12', 'ABOVE_12']         #in the order they arrive
+
+
+def column_sources(columns, categories):
+  """For every hotcoded column its (source column, category), e.g. WINDOW_0-2 -> (WINDOW, 0-2),
+  and (column, None) for the numeric ones.
+  """
+  sources = []
+  for name in columns:
+    source = next(((s, name[len(s)+1:]) for s, cats in categories.items()
+                   if name.startswith(s + '_') and name[len(s)+1:] in cats), (name, None))
+    sources.append(source)
+  return sources
+
+
+def encode_record(record, sources):
+  """Vector of one raw window in the order of `sources` (see column_sources), missing values are NaN."""
+  values = np.full(len(sources), np.nan)
+  for i, (source, category) in enumerate(sources):
+    value = record.get(source)
+    if category is not None:
+      values[i] = float(value is not None and str(value) == category)
+    elif value is not None:
+      values[i] = value
+  return values
+
+
+def window_rank(record):
+  """Position of the window of a raw record in WINDOWS."""
+  window = record.get(WINDOW_COLUMN)
+  if window not in WINDOWS:
+    raise ValueError("Window must be one of %s, got %r" % (WINDOWS, window))
+  return WINDOWS.index(window)
+
+
+class VisitState:
+  __slots__ = ('window', 'first', 'sums', 'counts', 'admitted')
+
+  def __init__(self, n_columns):
+    self.window = -1                  #rank of the last window added
+    self.first = None
+    self.sums = np.zeros(n_columns)
+    self.counts = np.zeros(n_columns, dtype=np.int64)
+    self.admitted = False
+
+
+class FeatureStore:
+  """Running per visit state keyed by PATIENT_VISIT_IDENTIFIER.
+
+  `columns` are the hotcoded feature columns (without the id and the label) and
+  `categories` the hotcoding categories of preprocessing_state(). Above
+  `max_visits` visits (None for no limit) the least recently updated ones are evicted.
+  """
+
+  def __init__(self, columns, categories, max_visits=None):
+    self.columns = list(columns)
+    self.sources = column_sources(self.columns, categories)
+    self.index = dict((name, i) for i, name in enumerate(self.columns))
+    self.max_visits = max_visits
+    self.visits = collections.OrderedDict()          #least recently updated first
+    self.evicted = 0
+
+  def add_window(self, record):
+    """Adds one raw window. Windows from the first ICU window of a visit on are
+    not part of the features, they only set the label of the visit to 1.
+
+    Raises ValueError, without changing the store, for a window that is not
+    later than the last window of its visit or that has a value that is not a
+    number, so the corrected window can be sent again.
+    """
+    visit_id = record[ID_COLUMN]
+    rank = window_rank(record)
+    state = self.visits.get(visit_id)
+    if state is not None and rank <= state.window:
+      raise ValueError("Window %s of visit %s arrived after window %s" % (WINDOWS[rank], visit_id, WINDOWS[state.window]))
+    admitted = record.get(LABEL_COLUMN) == 1
+    values = None
+    if not admitted and not (state is not None and state.admitted):
+      values = encode_record(record, self.sources)          #raises before anything is changed
+    if state is None:
+      state = self.visits[visit_id] = VisitState(len(self.columns))
+      self.evict()
+    else:
+      self.visits.move_to_end(visit_id)
+    state.window = rank
+    if values is None:
+      state.admitted = True
+      return
+    seen = ~np.isnan(values)
+    state.sums[seen] += values[seen]
+    state.counts += seen
+    if state.first is None:
+      state.first = values
+
+  def evict(self):
+    while self.max_visits is not None and len(self.visits) > self.max_visits:
+      self.visits.popitem(last=False)
+      self.evicted += 1
+
+  def discharge(self, visit_id):
+    """Drops a visit, e.g. once the patient left, returns whether it was in the store."""
+    return self.visits.pop(visit_id, None) is not None
+
+  def label(self, visit_id):
+    return int(self.visits[visit_id].admitted)
+
+  def features(self, visit_id, order=None):
+    """Window 0-2 of the visit with its NaN values filled by the running means,
+    in `order` (a list of column names) or in the store column order.
+    None when the patient was in the ICU from the first window on.
+    """
+    state = self.visits[visit_id]
+    if state.first is None:
+      return None
+    with np.errstate(invalid='ignore', divide='ignore'):
+      values = np.where(np.isnan(state.first), state.sums/state.counts, state.first)
+    if order is not None:
+      values = values[[self.index[name] for name in order]]
+    return values
+
+  def frame(self):
+    """Imputed window 0-2 of every visit with its label, one row per visit."""
+    ids = [visit_id for visit_id, state in self.visits.items() if state.first is not None]
+    rows = pd.DataFrame([self.features(visit_id) for visit_id in ids], columns=self.columns)
+    rows.insert(0, ID_COLUMN, ids)
+    rows[LABEL_COLUMN] = [self.label(visit_id) for visit_id in ids]
+    return rows
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Random forest sweeps that reuse the trees of one training pass.
+
+Depth: a forest is grown once to the largest depth and every shallower
+configuration is read off by stopping the tree traversal at that depth, where
+the class distribution stored in every internal node gives the prediction.
+Size: trees are added to an existing forest with warm_start instead of
+training every forest size from scratch.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import log_loss
+from sklearn.model_selection import check_cv
+
+
+def truncated_probas(forest, X, depths):
+  """Class probabilities of `forest` with every tree cut at each of `depths` levels,
+  as an array of shape (len(depths), rows, classes). Every tree is traversed once.
+  """
+  X = np.asarray(X, dtype=np.float32)            #trees split on float32 values
+  rows = np.arange(len(X))
+  proba = np.zeros((len(depths), len(X), len(forest.classes_)))
+  for estimator in forest.estimators_:
+    tree = estimator.tree_
+    value = tree.value[:, 0, :]
+    value = value/value.sum(axis=1, keepdims=True)
+    node = np.zeros(len(X), dtype=np.intp)
+    level = 0
+    for i, depth in sorted(enumerate(depths), key=lambda item: item[1]):
+      while level < depth:
+        inner = tree.children_left[node] != -1
+        if not inner.any():
+          break
+        go_left = X[rows, tree.feature[node]] <= tree.threshold[node]
+        node = np.where(inner, np.where(go_left, tree.children_left[node], tree.children_right[node]), node)
+        level += 1
+      proba[i] += value[node]
+  return proba/len(forest.estimators_)
+
+
+def truncated_predict(forest, X, depths):
+  """Predicted labels for every depth in `depths`, shape (len(depths), rows)."""
+  return forest.classes_[np.argmax(truncated_probas(forest, X, depths), axis=2)]
+
+
+def depth_curve(X_train, y_train, X_test, y_test, depths=range(1, 30), criteria=('gini', 'entropy'),
+                cv=5, n_jobs=None, loss=log_loss, **forest_params):
+  """Training and testing error of a random forest for every max_depth in `depths`.
+
+  For every criterion one forest of the largest depth is trained per CV fold and
+  one on the whole training set; all the depths are scored from those forests.
+  For each depth the criterion with the best mean CV accuracy is kept, as a grid
+  over criterion and max_depth would pick it. The number of forests trained is
+  in the `fits` attribute of the returned frame.
+  """
+  depths = list(depths)
+  max_depth = max(depths)
+  X_train, y_train = np.asarray(X_train), np.asarray(y_train)
+  cv = check_cv(cv, y_train, classifier=True)
+
+  def make_forest(criterion):
+    return RandomForestClassifier(criterion=criterion, max_depth=max_depth, n_jobs=n_jobs, **forest_params)
+
+  cv_scores = {}
+  full_forests = {}
+  for criterion in criteria:
+    fold_scores = np.zeros((len(depths), cv.get_n_splits()))
+    for fold, (train, test) in enumerate(cv.split(X_train, y_train)):
+      forest = make_forest(criterion).fit(X_train[train], y_train[train])
+      fold_scores[:, fold] = np.mean(truncated_predict(forest, X_train[test], depths) == y_train[test], axis=1)
+    cv_scores[criterion] = fold_scores.mean(axis=1)
+    full_forests[criterion] = make_forest(criterion).fit(X_train, y_train)
+
+  train_predictions = dict((c, truncated_predict(full_forests[c], X_train, depths)) for c in criteria)
+  test_predictions = dict((c, truncated_predict(full_forests[c], X_test, depths)) for c in criteria)
+  rows = []
+  for i, depth in enumerate(depths):
+    criterion = max(criteria, key=lambda c: cv_scores[c][i])        #first criterion wins a tie
+    rows.append({'max_depth': depth, 'criterion': criterion, 'cv_score': cv_scores[criterion][i],
+                 'train_error': loss(y_train, train_predictions[criterion][i]),
+                 'test_error': loss(y_test, test_predictions[criterion][i])})
+  curve = pd.DataFrame(rows)
+  curve.attrs['fits'] = len(criteria)*(cv.get_n_splits()+1)
+  return curve
+
+
+def size_curve(X_train, y_train, X_test, y_test, sizes=(10, 25, 50, 100, 200), loss=log_loss, **forest_params):
+  """Training and testing error for growing numbers of trees, every size adds trees to the previous forest.
+
+  The number of trees trained, the largest size instead of the sum of the sizes,
+  is in the `trees` attribute of the returned frame.
+  """
+  forest = RandomForestClassifier(warm_start=True, **forest_params)
+  rows = []
+  for size in sorted(sizes):
+    forest.set_params(n_estimators=size).fit(X_train, y_train)
+    rows.append({'n_estimators': size, 'train_error': loss(y_train, forest.predict(X_train)),
+                 'test_error': loss(y_test, forest.predict(X_test))})
+  curve = pd.DataFrame(rows)
+  curve.attrs['trees'] = len(forest.estimators_)
+  return curve
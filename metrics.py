@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Vectorized evaluation of many models, folds or thresholds at once.
+
+Predictions are stacked as a (models, rows) matrix against one vector of true
+labels and every metric is computed along the rows in NumPy. Results come back
+as a DataFrame with one row per stacked prediction instead of being printed.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+EPS = 1e-15
+
+
+def as_matrix(values):
+  values = np.asarray(values)
+  return values[None, :] if values.ndim == 1 else values
+
+
+def confusion_counts(y_true, predictions):
+  """tn, fp, fn, tp of every row of the stacked 0/1 `predictions`."""
+  y_true = np.asarray(y_true).astype(bool)
+  predictions = as_matrix(predictions).astype(bool)
+  tp = (predictions & y_true).sum(axis=1)
+  fp = (predictions & ~y_true).sum(axis=1)
+  positives = y_true.sum()
+  return len(y_true)-positives-fp, fp, positives-tp, tp
+
+
+def roc_auc(y_true, scores):
+  """ROC-AUC of every row of `scores` from the Mann-Whitney rank statistic, ties count one half.
+
+  NaN when y_true has a single class, where ROC-AUC is undefined.
+  """
+  y_true = np.asarray(y_true).astype(bool)
+  scores = as_matrix(scores)
+  positives = y_true.sum()
+  negatives = len(y_true)-positives
+  if positives == 0 or negatives == 0:
+    return np.full(len(scores), np.nan)
+  ranks = rankdata(scores.astype(np.float64), axis=1)
+  return (ranks[:, y_true].sum(axis=1) - positives*(positives+1)/2)/(positives*negatives)
+
+
+def log_loss(y_true, proba):
+  """Mean binary cross entropy of every row of ICU probabilities."""
+  y_true = np.asarray(y_true).astype(bool)
+  proba = np.clip(as_matrix(proba).astype(np.float64), EPS, 1-EPS)
+  return -np.where(y_true, np.log(proba), np.log1p(-proba)).mean(axis=1)
+
+
+def evaluate(y_true, predictions, proba=None, scores=None, names=None):
+  """Confusion counts, accuracy, sensitivity, specificity, ROC-AUC and log-loss of stacked predictions.
+
+  ROC-AUC is computed from `proba` (probability of ICU), else from any ranking
+  `scores` such as a decision function, else from the hard labels like ass()
+  did. Log-loss needs `proba` and is NaN without it. When models are stacked,
+  the rows of `proba` or `scores` of a model without them are NaN, and that
+  model falls back to the next ranking.
+  """
+  tn, fp, fn, tp = confusion_counts(y_true, predictions)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    table = pd.DataFrame({'tn': tn, 'fp': fp, 'fn': fn, 'tp': tp,
+                          'accuracy': (tp+tn)/(tp+fp+fn+tn),
+                          'sensitivity': tp/(tp+fn),
+                          'specificity': tn/(tn+fp)}, index=names)
+  ranking = as_matrix(predictions).astype(np.float64)
+  for values in (scores, proba):              #proba first, then scores, then the hard labels
+    if values is not None:
+      values = as_matrix(values).astype(np.float64)
+      ranking = np.where(np.isnan(values).all(axis=1, keepdims=True), ranking, values)
+  table['roc_auc'] = roc_auc(y_true, ranking)
+  table['log_loss'] = log_loss(y_true, proba) if proba is not None else np.nan
+  return table
+
+
+def threshold_sweep(y_true, proba, thresholds=np.linspace(0, 1, 101)):
+  """Metrics of one model's ICU probabilities at every decision threshold (ICU when proba >= threshold)."""
+  thresholds = np.asarray(thresholds)
+  predictions = np.asarray(proba)[None, :] >= thresholds[:, None]
+  table = evaluate(y_true, predictions, names=pd.Index(thresholds, name='threshold')).drop(columns=['roc_auc', 'log_loss'])
+  table['youden'] = table['sensitivity'] + table['specificity'] - 1
+  return table
+
+
+def operating_point(sweep, min_sensitivity=0.9):
+  """Threshold with the best specificity among those reaching `min_sensitivity`, as a row of the sweep.
+
+  For ICU triage a missed admission costs more than a false alarm, so the
+  sensitivity is the constraint and specificity what is maximized.
+  """
+  eligible = sweep[sweep['sensitivity'] >= min_sensitivity]
+  if eligible.empty:
+    return sweep.loc[sweep['sensitivity'].idxmax()]
+  return eligible.loc[eligible['specificity'].idxmax()]
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Hyperparameter searches over the classifiers of the model zoo."""
+
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.base import clone
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import log_loss
+from sklearn.model_selection import GridSearchCV, check_cv, cross_validate
+from sklearn.pipeline import make_pipeline
+
+SEARCH_MODES = ('grid', 'halving')
+
+
+def make_sgd(seed):
+  return make_pipeline(SGDClassifier(random_state=seed))
+
+
+def score_seed(make_estimator, seed, X, y, cv):
+  """Mean cross validation score of the estimator built with `seed`, with its per fit time."""
+  start = time.perf_counter()
+  result = cross_validate(make_estimator(seed), X, y, cv=cv)
+  return {'seed': seed, 'score': result['test_score'].mean(), 'fit_seconds': result['fit_time'].mean(),
+          'wall_seconds': time.perf_counter()-start}
+
+
+def seed_search(make_estimator, X, y, budget=10000, patience=500, cv=5, n_jobs=-1, batch_size=None):
+  """Scores the seeds 1..budget-1 on CV folds across a process pool.
+
+  Seeds are dispatched in batches and the search stops once `patience` seeds in
+  a row did not improve on the best score. `make_estimator(seed)` must be a
+  module level function so it can be sent to the workers. Returns the table of
+  every scored seed in seed order, with the number of fits in attrs['fits'].
+  """
+  seeds = np.arange(1, budget)
+  batch_size = batch_size or 4*effective_n_jobs(n_jobs)
+  rows = []
+  best, best_index = -np.inf, 0
+  with Parallel(n_jobs=n_jobs) as parallel:
+    for start in range(0, len(seeds), batch_size):
+      rows.extend(parallel(delayed(score_seed)(make_estimator, int(seed), X, y, cv)
+                           for seed in seeds[start:start+batch_size]))
+      for i in range(start, len(rows)):
+        if rows[i]['score'] > best:
+          best, best_index = rows[i]['score'], i
+      if len(rows)-1-best_index >= patience:
+        break
+  table = pd.DataFrame(rows)
+  table.attrs['fits'] = len(table)*check_cv(cv, y, classifier=True).get_n_splits()
+  return table
+
+
+def best_seed(seed_table):
+  """First seed with the highest score, as the original serial loop picked it."""
+  return int(seed_table.loc[seed_table['score'].idxmax(), 'seed'])
+
+
+def sweep_curves(search, param, X_train, y_train, X_test, y_test, loss=log_loss):
+  """Training and testing error for every value of `param`, taken from an already fitted GridSearchCV.
+
+  For each value the candidate with the best mean CV score among those having
+  that value is refitted and scored, which is the model a separate grid search
+  restricted to that value would return. With successive halving only the
+  candidates of the last round that value reached are compared. Returns one
+  row per value, in grid order.
+  """
+  results = pd.DataFrame(search.cv_results_)
+  rows = []
+  for value, group in results.groupby('param_'+param, sort=False):
+    if 'iter' in group:                                   #successive halving, only the largest budget reached is comparable
+      group = group[group['iter'] == group['iter'].max()]
+    best = group['mean_test_score'].idxmax()
+    params = results.loc[best, 'params']
+    model = clone(search.estimator).set_params(**params).fit(X_train, y_train)
+    rows.append({param: value, 'params': params, 'cv_score': results.loc[best, 'mean_test_score'],
+                 'train_error': loss(y_train, model.predict(X_train)),
+                 'test_error': loss(y_test, model.predict(X_test))})
+  return pd.DataFrame(rows)
+
+
+def grid_fits(search, curves=None):
+  """Number of fits done by a GridSearchCV, its refit and the refits of the curves derived from it."""
+  fits = len(search.cv_results_['params'])*search.n_splits_ + int(bool(search.refit))
+  if curves is not None:
+    fits += len(curves)
+  return fits
+
+
+def dead_parameters(estimator, param_grid, X, y, probes=3, max_samples=500, random_state=0):
+  """Names of the grid parameters that never change the predictions.
+
+  Every parameter is varied over all its values while the others are held at
+  `probes` random points of the grid, on a subsample of at most `max_samples`
+  rows. A parameter is dead when the predictions are identical at every probe.
+  """
+  rng = np.random.RandomState(random_state)
+  rows = rng.permutation(len(X))[:max_samples]
+  X, y = X[rows], y[rows]
+  bases = [dict((name, values[rng.randint(len(values))]) for name, values in param_grid.items())
+           for _ in range(probes)]
+  dead = []
+  for name, values in param_grid.items():
+    if len(values) < 2:
+      continue
+    for base in bases:
+      predictions = [clone(estimator).set_params(**dict(base, **{name: value})).fit(X, y).predict(X) for value in values]
+      if any(not np.array_equal(predictions[0], p) for p in predictions[1:]):
+        break
+    else:
+      dead.append(name)
+  return dead
+
+
+def search(estimator, param_grid, X, y, mode='grid', cv=5, collapse=False, factor=3, random_state=0, n_jobs=None):
+  """Fits a hyperparameter search and returns it, with the usual best_params_ / cv_results_.
+
+  mode='grid' is the exhaustive GridSearchCV. mode='halving' runs successive
+  halving: every candidate is first scored on a small part of the training
+  data and only the best 1/`factor` are promoted to the next, `factor` times
+  larger, budget. With collapse=True the parameters found by dead_parameters
+  are pinned to their first value, so they still show in best_params_.
+  """
+  param_grid = dict((name, list(values)) for name, values in param_grid.items())
+  if collapse:
+    for name in dead_parameters(estimator, param_grid, X, y, random_state=random_state):
+      param_grid[name] = param_grid[name][:1]
+  if mode == 'grid':
+    searcher = GridSearchCV(estimator, param_grid, cv=cv, n_jobs=n_jobs)
+  elif mode == 'halving':
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingGridSearchCV
+    searcher = HalvingGridSearchCV(estimator, param_grid, cv=cv, factor=factor, random_state=random_state, n_jobs=n_jobs)
+  else:
+    raise ValueError("Unknown search mode %r, expected one of %s" % (mode, SEARCH_MODES))
+  return searcher.fit(X, y)
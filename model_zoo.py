@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Concurrent training of the model zoo.
+
+Every classifier is fitted in its own worker process. The training and testing
+arrays are written once to `.npy` files and memory-mapped by the workers, so
+they are not pickled for every task. Each worker caps its BLAS/OpenMP threads
+so that workers x threads does not oversubscribe the cores, and a model with
+its own n_jobs (the random forest) takes its jobs out of the same per-worker
+budget.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegressionCV, SGDClassifier
+from sklearn.naive_bayes import GaussianNB
+from sklearn.neural_network import MLPClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn import svm, tree
+from threadpoolctl import threadpool_limits
+
+from metrics import evaluate
+from neighbors import NeighborIndex
+from profiling import peak_rss_mb
+
+MLP_ACTIVATIONS = ["identity", "logistic", "tanh", "relu"]
+
+
+def zoo_models(sgd_seed=1, rf_jobs=1):
+  """The classifiers of the notebook with their chosen hyperparameters, by name.
+
+  The random forest is fitted with `rf_jobs` jobs, at most the threads of its worker (see run_zoo).
+  """
+  models = {
+    'Logistic Regression': make_pipeline(LogisticRegressionCV(cv=5,random_state=1,max_iter=5000)),
+    'Gaussian Naive Bayes': make_pipeline(GaussianNB()),
+    'SGD': make_pipeline(SGDClassifier(random_state=sgd_seed)),
+    'Linear SVM': make_pipeline(svm.SVC(kernel='linear')),
+    'Decision Tree': tree.DecisionTreeClassifier(criterion='entropy',max_depth=4,max_leaf_nodes=10),
+    'KNN': NeighborIndex(n_neighbors=25,max_k=40,p=1),
+    'Random Forest': RandomForestClassifier(criterion='gini',random_state=23,max_depth=6,bootstrap=True,n_jobs=rf_jobs),
+  }
+  for a in MLP_ACTIVATIONS:
+    models['MLP ' + a] = MLPClassifier(activation=a,max_iter=10000, batch_size=64,alpha=0.1,random_state=1)
+  return models
+
+
+def ranking_scores(estimator, X):
+  """Probability of ICU if the model has one, else its decision function, else None."""
+  if hasattr(estimator, 'predict_proba'):
+    return estimator.predict_proba(X)[:, 1], None
+  if hasattr(estimator, 'decision_function'):
+    return None, estimator.decision_function(X)
+  return None, None
+
+
+def blas_threads_per_worker(n_workers):
+  return max(1, (os.cpu_count() or 1)//n_workers)
+
+
+def share_arrays(folder, **arrays):
+  """Saves the arrays as `.npy` files in `folder` and returns their paths by name."""
+  paths = {}
+  for name, values in arrays.items():
+    paths[name] = os.path.join(folder, name + '.npy')
+    np.save(paths[name], np.ascontiguousarray(values))
+  return paths
+
+
+def thread_budget(estimator, threads):
+  """n_jobs to fit `estimator` with and BLAS threads per job, so that jobs x BLAS threads stays within `threads`.
+
+  n_jobs is None for the models without it.
+  """
+  if 'n_jobs' not in estimator.get_params(deep=False):
+    return None, threads
+  jobs = min(effective_n_jobs(estimator.get_params()['n_jobs']), threads)
+  return jobs, max(1, threads//jobs)
+
+
+def fit_and_score(name, estimator, paths, blas_threads):
+  """Worker task: fits one model on the memory-mapped arrays and times fit and predict.
+
+  The model fits within the `blas_threads` threads of its worker, its own n_jobs
+  included, which is set back to the requested value once it is fitted.
+  Returns the timings, the fitted model and its (predictions, proba, scores) on the test rows.
+  """
+  X_train, y_train, X_test, y_test = (np.load(paths[key], mmap_mode='r') for key in ('X_train', 'y_train', 'X_test', 'y_test'))
+  jobs, blas_threads = thread_budget(estimator, blas_threads)
+  if jobs is not None:
+    requested = estimator.get_params()['n_jobs']
+    estimator.set_params(n_jobs=jobs)
+  with threadpool_limits(limits=blas_threads):
+    start, cpu = time.perf_counter(), time.process_time()
+    estimator.fit(X_train, y_train)
+    fit_seconds, fit_cpu_seconds = time.perf_counter()-start, time.process_time()-cpu
+    start = time.perf_counter()
+    y_pred = estimator.predict(X_test)
+    predict_seconds = time.perf_counter()-start
+    proba, scores = ranking_scores(estimator, X_test)
+  if jobs is not None:
+    estimator.set_params(n_jobs=requested)
+  row = {'model': name, 'fit_seconds': fit_seconds, 'fit_cpu_seconds': fit_cpu_seconds, 'predict_seconds': predict_seconds,
+         'predict_ms_per_row': predict_seconds*1000/len(X_test), 'worker_peak_rss_mb': peak_rss_mb()}
+  return row, estimator, (y_pred, proba, scores)
+
+
+def evaluate_outputs(y_test, outputs, names):
+  """metrics.evaluate of the stacked (predictions, proba, scores) of every model in one call,
+  with NaN rows for the models without proba or scores.
+  """
+  def stack(i):
+    if all(output[i] is None for output in outputs):
+      return None
+    return np.vstack([np.full(len(y_test), np.nan) if output[i] is None else output[i] for output in outputs])
+  return evaluate(y_test, np.vstack([output[0] for output in outputs]), proba=stack(1), scores=stack(2),
+                  names=pd.Index(names, name='model'))
+
+
+def run_zoo(models, X_train, y_train, X_test, y_test, n_workers=-1, blas_threads=None):
+  """Fits every model of `models` concurrently in a process pool.
+
+  `blas_threads` are the threads of every worker, the cores shared out between
+  the workers by default. Returns the comparison table of metrics.evaluate with
+  the fit and predict latency, fit CPU time and worker peak RSS of every model,
+  and the fitted models by name.
+  """
+  n_workers = min(effective_n_jobs(n_workers), len(models))
+  blas_threads = blas_threads or blas_threads_per_worker(n_workers)
+  folder = tempfile.mkdtemp(prefix='icu_zoo_')
+  try:
+    paths = share_arrays(folder, X_train=X_train, y_train=y_train, X_test=X_test, y_test=y_test)
+    results = Parallel(n_jobs=n_workers)(delayed(fit_and_score)(name, estimator, paths, blas_threads)
+                                         for name, estimator in models.items())
+  finally:
+    shutil.rmtree(folder, ignore_errors=True)
+  table = pd.DataFrame([row for row, _, _ in results]).set_index('model')
+  table = table.join(evaluate_outputs(y_test, [output for _, _, output in results], table.index))
+  fitted = dict((row['model'], estimator) for row, estimator, _ in results)
+  return table, fitted
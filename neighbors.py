@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""K-nearest neighbour classification from a neighbour list computed once.
+
+The neighbours of a point are sorted once up to the largest k of interest. The
+votes of every smaller k are then read off a cumulative sum over that sorted
+list, so a whole n_neighbors sweep costs a single neighbour query per fold and
+metric. Labels are expected to be 0/1 (ICU label).
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.model_selection import ParameterGrid, check_cv
+from sklearn.neighbors import NearestNeighbors
+
+
+def votes_to_labels(votes, k):
+  """Majority vote of the first k neighbours, a tie goes to class 0 like KNeighborsClassifier."""
+  return (2*votes[:, k-1] > k).astype(int)
+
+
+class NeighborIndex(BaseEstimator, ClassifierMixin):
+  """KNN classifier that keeps the neighbour structure of the training data for
+  every k up to `max_k`, so predictions for any k reuse the same index.
+  """
+
+  def __init__(self, n_neighbors=25, max_k=40, p=2):
+    self.n_neighbors = n_neighbors
+    self.max_k = max_k
+    self.p = p
+
+  def fit(self, X, y):
+    self.y_ = np.asarray(y).astype(int)
+    self.classes_ = np.array([0, 1])
+    self.tree_ = NearestNeighbors(n_neighbors=max(self.max_k, self.n_neighbors), p=self.p).fit(X)
+    return self
+
+  def check_k(self, k):
+    """k, n_neighbors by default, once checked against the neighbours kept by the index."""
+    k = self.n_neighbors if k is None else k
+    kept = self.tree_.n_neighbors
+    if not 1 <= k <= kept:
+      raise ValueError("k must be between 1 and %d, the neighbours kept by the index, got %r" % (kept, k))
+    return k
+
+  def neighbor_votes(self, X):
+    """Column k-1 holds the number of ICU labels among the k nearest training points."""
+    ind = self.tree_.kneighbors(X, return_distance=False)
+    return np.cumsum(self.y_[ind], axis=1)
+
+  def predict_proba(self, X, k=None):
+    k = self.check_k(k)
+    positive = self.neighbor_votes(X)[:, k-1]/k
+    return np.column_stack([1-positive, positive])
+
+  def predict(self, X, k=None):
+    k = self.check_k(k)
+    return votes_to_labels(self.neighbor_votes(X), k)
+
+
+class KNNSearch:
+  """Cross validated search over n_neighbors and p with one neighbour query per fold and p.
+
+  Exposes the GridSearchCV attributes used by the rest of the pipeline:
+  cv_results_, best_params_, best_score_, best_estimator_, n_splits_ and
+  predict/score with the refitted best model.
+  """
+
+  def __init__(self, n_neighbors=(10, 15, 20, 25, 30, 35, 40), p=(1, 2), cv=5):
+    self.n_neighbors = list(n_neighbors)
+    self.p = list(p)
+    self.cv = cv
+    self.estimator = NeighborIndex()
+    self.refit = True
+
+  def fit(self, X, y):
+    X, y = np.asarray(X), np.asarray(y).astype(int)
+    cv = check_cv(self.cv, y, classifier=True)
+    max_k = max(self.n_neighbors)
+    candidates = list(ParameterGrid({'n_neighbors': self.n_neighbors, 'p': self.p}))
+    scores = np.zeros((len(candidates), cv.get_n_splits()))
+    for fold, (train, test) in enumerate(cv.split(X, y)):
+      for p in self.p:
+        votes = NeighborIndex(max_k=max_k, p=p).fit(X[train], y[train]).neighbor_votes(X[test])
+        for c, params in enumerate(candidates):
+          if params['p'] == p:
+            scores[c, fold] = np.mean(votes_to_labels(votes, params['n_neighbors']) == y[test])
+
+    self.n_splits_ = cv.get_n_splits()
+    self.n_index_builds_ = self.n_splits_*len(self.p) + 1
+    mean = scores.mean(axis=1)
+    self.cv_results_ = {'params': candidates,
+                        'param_n_neighbors': [c['n_neighbors'] for c in candidates],
+                        'param_p': [c['p'] for c in candidates],
+                        'mean_test_score': mean, 'std_test_score': scores.std(axis=1),
+                        'rank_test_score': pd.Series(-mean).rank(method='min').astype(int).to_numpy()}
+    for fold in range(self.n_splits_):
+      self.cv_results_['split%d_test_score' % fold] = scores[:, fold]
+    self.best_index_ = int(np.argmax(mean))
+    self.best_params_ = candidates[self.best_index_]
+    self.best_score_ = mean[self.best_index_]
+    self.best_estimator_ = NeighborIndex(max_k=max_k, **self.best_params_).fit(X, y)
+    return self
+
+  def predict(self, X, k=None):
+    return self.best_estimator_.predict(X, k)
+
+  def predict_proba(self, X, k=None):
+    return self.best_estimator_.predict_proba(X, k)
+
+  def score(self, X, y):
+    return self.best_estimator_.score(X, y)
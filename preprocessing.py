@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Pre-processing stages for the Sirio-Libanes ICU dataset.
+
+Every stage works on whole columns with grouped pandas/NumPy operations, so the
+cost grows linearly with the number of window rows instead of once per patient.
+Rows are expected in the order of the source sheet, i.e. the windows of a visit
+follow each other from WINDOW_0-2 to WINDOW_ABOVE_12.
+
+Frames are kept in a compact schema through all the stages: the binary columns
+(comorbidities, hotcoded windows and age percentiles, the label) are uint8 and
+the lab and vital measurements are float32.
+"""
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMN = 'PATIENT_VISIT_IDENTIFIER'
+LABEL_COLUMN = 'ICU'
+
+BINARY_COLUMNS = ['AGE_ABOVE65', 'GENDER', 'DISEASE GROUPING 1', 'DISEASE GROUPING 2', 'DISEASE GROUPING 3',
+                  'DISEASE GROUPING 4', 'DISEASE GROUPING 5', 'DISEASE GROUPING 6', 'HTN', 'IMMUNOCOMPROMISED',
+                  'OTHER', LABEL_COLUMN]
+BINARY_PREFIXES = ('WINDOW_', 'AGE_PERCENTIL_')       #hotcoded columns
+DROP_COLUMNS = ['GENDER', ID_COLUMN, 'WINDOW_0-2', 'WINDOW_2-4', 'WINDOW_4-6', 'WINDOW_6-12', 'WINDOW_ABOVE_12']    #not features once the first window is imputed
+
+
+def is_binary_column(name):
+  return name in BINARY_COLUMNS or name.startswith(BINARY_PREFIXES)
+
+
+def compact_dtypes(data, id_column=ID_COLUMN):
+  """Casts a frame to the compact schema: binary columns to uint8, the patient id to
+  int32 and every other numeric column to float32.
+
+  A binary column that still has NaN (or imputed non 0/1) values stays float32.
+  """
+  dtypes = {}
+  for name in data.columns:
+    values = data[name]
+    if not pd.api.types.is_numeric_dtype(values):
+      continue
+    if name == id_column:
+      dtypes[name] = np.int32
+    elif is_binary_column(name):
+      dtypes[name] = np.uint8 if values.isin([0, 1]).all() else np.float32
+    else:
+      dtypes[name] = np.float32
+  return data.astype(dtypes)
+
+
+def propagate_icu_labels(data, id_column=ID_COLUMN, label_column=LABEL_COLUMN):
+  """Marks every window of an ICU admitted patient with label 1 and removes the
+  windows in which the patient was already in the ICU.
+
+  A visit may have any number of windows. The windows before the first one
+  labelled 1 are kept and relabelled, that window and all later ones are dropped.
+  """
+  admitted = (data[label_column] == 1).to_numpy()
+  visits = pd.Series(admitted).groupby(data[id_column].to_numpy(), sort=False)
+  ever_admitted = visits.transform('max').to_numpy()        #patient goes to the ICU in some window
+  admitted_so_far = visits.cummax().to_numpy()              #patient is already in the ICU in this window
+  keep = ~admitted_so_far
+
+  labelled = data.loc[keep].reset_index(drop=True)
+  labelled[label_column] = ever_admitted[keep].astype(data[label_column].dtype)
+  return labelled
+
+
+def one_hot_encode(data, label_column=LABEL_COLUMN):
+  """Binary hotcoding of the non numeric columns, the label column is kept at the last position."""
+  without_label = data.drop(label_column, axis = 1)
+  colums_to_convert = without_label.select_dtypes(exclude='number').columns
+  encoded = pd.get_dummies(without_label, columns = colums_to_convert, dtype = np.uint8)
+  return pd.concat([encoded, data[label_column]], axis = 1)
+
+
+def impute_first_window(data, id_column=ID_COLUMN):
+  """Keeps only the first window (0-2) of every patient and fills its NaN values with
+  the mean of that column over all the remaining windows of the same patient.
+
+  The per patient means come from a single groupby, so no per patient frame is built.
+  """
+  first_window = data.drop_duplicates(id_column)             #first row of every visit, original index kept
+  visit_means = data.groupby(id_column, sort=False).mean()
+  fill_values = visit_means.reindex(first_window[id_column].to_numpy())
+  fill_values.index = first_window.index
+  return first_window.fillna(fill_values)
+
+
+def dummy_categories(data):
+  """Categories of every hotcoded column, the state needed to encode new records the same way."""
+  return dict((name, sorted(str(v) for v in data[name].dropna().unique()))
+              for name in data.select_dtypes(exclude='number').columns if name != LABEL_COLUMN)
+
+
+def preprocessing_state(data, categories=None):
+  """Conventions of the pre-processing stages, saved with every trained model.
+
+  `categories` replaces dummy_categories(data) when the raw frame was never in
+  memory, e.g. the categories collected by chunked.scan_categories.
+  """
+  return {'categories': dummy_categories(data) if categories is None else categories,
+          'label': 'windows of a visit before its first ICU window take label 1, ICU windows are removed',
+          'imputation': 'first window of the visit, NaN filled with the mean of the remaining windows of the visit',
+          'dropna': True,
+          'dtypes': {'binary': 'uint8', 'continuous': 'float32'}}
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Headless report of a training run: every figure rendered to PNG in worker processes.
+
+A figure is queued with Report.add(name, function, *args). The function draws
+one or more matplotlib figures, as the plot sections of covid19_icu_prediction
+do, and runs in a worker process with the Agg backend, where plt.show() draws
+nothing on screen, and every figure it drew is saved as `<name>-<i>.png`.
+The figures render while the pipeline goes on with its next stages. close()
+waits for them and writes the bundle:
+
+    <root>/<run>/index.html      the figures and the tables added with add_table
+    <root>/<run>/<name>-<i>.png
+
+Correlation matrices are drawn by plot_heatmap as one rasterized image: the
+features are ordered by hierarchical clustering, so correlated features sit
+together, and matrices larger than MAX_CELLS are averaged over blocks of
+consecutive clustered features down to MAX_CELLS x MAX_CELLS cells.
+"""
+
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+REPORT_ROOT = 'reports'
+MAX_CELLS = 60                 #rows/columns of a drawn correlation matrix
+CELL_INCHES = 0.25
+DPI = 100
+
+
+def cluster_order(corr):
+  """Features of a correlation matrix in the leaf order of an average-linkage clustering on 1-|corr|."""
+  from scipy.cluster.hierarchy import leaves_list, linkage
+  from scipy.spatial.distance import squareform
+  values = np.nan_to_num(np.asarray(corr, dtype=np.float64))           #constant columns correlate with nothing
+  if len(values) < 3:
+    return np.arange(len(values))
+  distance = 1 - np.abs(values)
+  np.fill_diagonal(distance, 0)
+  distance = np.clip((distance + distance.T)/2, 0, None)
+  return leaves_list(linkage(squareform(distance, checks=False), method='average'))
+
+
+def downsample(corr, max_cells=MAX_CELLS):
+  """Clustered correlation matrix averaged over blocks of consecutive features, and the block labels.
+
+  A block of several features is labelled by its first feature and the number of the others.
+  """
+  names = list(corr.index)
+  order = cluster_order(corr)
+  values = np.asarray(corr, dtype=np.float64)[np.ix_(order, order)]
+  names = [names[i] for i in order]
+  if len(names) <= max_cells:
+    return values, names
+  edges = np.linspace(0, len(names), max_cells + 1).round().astype(int)
+  with np.errstate(invalid='ignore'):
+    rows = np.add.reduceat(np.nan_to_num(values), edges[:-1], axis=0)
+    blocks = np.add.reduceat(rows, edges[:-1], axis=1)/np.outer(np.diff(edges), np.diff(edges))
+  labels = [names[a] if b - a == 1 else '%s +%d' % (names[a], b - a - 1) for a, b in zip(edges[:-1], edges[1:])]
+  return blocks, labels
+
+
+def plot_heatmap(corr, title='Correlation', max_cells=MAX_CELLS):
+  """Clustered, downsampled correlation matrix drawn as one rasterized image."""
+  import matplotlib.pyplot as plt
+  values, labels = downsample(corr, max_cells)
+  size = max(6, CELL_INCHES*len(labels) + 3)
+  fig, ax = plt.subplots(figsize=(size, size))
+  image = ax.imshow(values, vmin=-1, vmax=1, cmap='RdBu_r', interpolation='nearest', rasterized=True)
+  ax.set_xticks(np.arange(len(labels)))
+  ax.set_yticks(np.arange(len(labels)))
+  ax.set_xticklabels(labels, rotation=90, fontsize=7)
+  ax.set_yticklabels(labels, fontsize=7)
+  ax.set_title(title)
+  fig.colorbar(image, ax=ax, shrink=0.6)
+  fig.tight_layout()
+  return fig
+
+
+def render_figures(folder, name, function, args, kwargs):
+  """Worker: draws function(*args, **kwargs) with the Agg backend and saves every figure with axes.
+
+  plt.show() starts a new figure, so the plot sections that draw several figures
+  one after the other, each ended by plt.show(), do not draw over each other.
+  """
+  import matplotlib
+  matplotlib.use('Agg')
+  import matplotlib.pyplot as plt
+  from profiling import peak_rss_mb
+  start, cpu = time.perf_counter(), time.process_time()
+  plt.close('all')
+  plt.show = lambda *args, **kwargs: plt.figure()            #the worker process only renders figures
+  function(*args, **kwargs)
+  figures = [fig for fig in map(plt.figure, plt.get_fignums()) if fig.axes]
+  files = ['%s-%d.png' % (name, i) for i in range(len(figures))]
+  for fig, file in zip(figures, files):
+    fig.savefig(os.path.join(folder, file), dpi=DPI, bbox_inches='tight')
+  plt.close('all')
+  return files, time.perf_counter() - start, {'cpu_seconds': time.process_time() - cpu, 'peak_rss': peak_rss_mb()}
+
+
+def run_folder(root=REPORT_ROOT, key=None):
+  """<root>/<date>-<time>[-<key>], a new folder for every run."""
+  run = time.strftime('%Y%m%d-%H%M%S') + ('-' + key if key else '')
+  folder = os.path.join(root, run)
+  os.makedirs(folder, exist_ok=True)
+  return folder
+
+
+class Report:
+  """Figures and tables of one run, see the module docstring."""
+
+  def __init__(self, folder, title='Predicting ICU admission of confirmed COVID-19 cases', workers=None):
+    self.folder = folder
+    self.title = title
+    self.workers = workers
+    self.items = []                    #(name, future or list of files), in the order they were added
+    self.tables = []
+    self.executor = None
+
+  def add(self, name, function, *args, **kwargs):
+    """Queues the figures drawn by function(*args, **kwargs), it must be importable by the workers."""
+    if self.executor is None:
+      self.executor = ProcessPoolExecutor(self.workers)
+    self.items.append((name, self.executor.submit(render_figures, self.folder, name, function, args, kwargs)))
+
+  def add_image(self, name, path):
+    """An image rendered by other means, e.g. the graphviz decision tree."""
+    self.items.append((name, [os.path.relpath(path, self.folder)]))
+
+  def add_table(self, name, frame):
+    self.tables.append((name, frame.to_html(float_format=lambda v: '%.4f' % v)))
+
+  def close(self):
+    """Waits for the figures, writes index.html and returns its path."""
+    from profiling import record
+    sections = []
+    for name, result in self.items:
+      if isinstance(result, list):
+        files = result
+      else:
+        files, seconds, measures = result.result()
+        record('render-' + name, seconds, **measures)
+      sections.append('<h2>%s</h2>\n%s' % (html.escape(name), '\n'.join('<img src="%s">' % html.escape(f) for f in files)))
+    if self.executor is not None:
+      self.executor.shutdown()
+    sections += ['<h2>%s</h2>\n%s' % (html.escape(name), table) for name, table in self.tables]
+    path = os.path.join(self.folder, 'index.html')
+    with open(path, 'w') as f:
+      f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>%s</title>\n'
+              '<style>body{font-family:sans-serif} img{max-width:100%%; display:block; margin:1em 0}</style></head>\n'
+              '<body><h1>%s</h1>\n%s\n</body></html>\n' % (html.escape(self.title), html.escape(self.title), '\n'.join(sections)))
+    return path
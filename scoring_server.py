@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Long-lived ICU risk scoring service.
+
+The trained model is loaded once. Requests come in over HTTP (TCP or a Unix
+socket) and carry one or more window 0-2 records. The records of concurrent
+requests are micro-batched into a single vectorized predict_proba call.
+
+    python3 scoring_server.py artifacts --name random_forest --port 8000
+    python3 scoring_server.py artifacts --name random_forest --unix-socket /tmp/icu.sock
+    python3 scoring_server.py artifacts --name random_forest --compiled
+
+POST /predict  {"records": [{"AGE_ABOVE65": 1, ...}, ...]}  or a single record
+               -> {"probabilities": [0.12, ...]}
+POST /windows  {"records": [{"PATIENT_VISIT_IDENTIFIER": 7, "WINDOW": "0-2", ...}, ...]}  raw windows
+               as they arrive, added to the per visit feature store (feature_store.py)
+               -> {"visits": [7], "probabilities": [0.12], "admitted": [false]}
+POST /discharge  {"visits": [7, ...]}  drops the visits from the feature store
+               -> {"discharged": [true, ...]}
+GET  /stats    -> request count, p50/p99 latency in ms, throughput and the visits held and evicted
+
+A visit of /windows is scored on its imputed window 0-2, its probability is
+null while a feature has no value in any of its windows yet, or when the
+patient was in the ICU from the first window on. The store keeps at most
+--max-visits visits, the least recently updated ones are evicted first.
+"""
+
+import argparse
+import collections
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+MAX_VISITS = 50000             #visits held by the /windows feature store, a few kB each
+
+
+class MicroBatcher:
+  """Collects the rows of concurrent requests and scores them with one predict_proba call.
+
+  A batch is closed when it has `max_batch` rows or `max_wait` seconds passed
+  since its first request arrived.
+  """
+
+  def __init__(self, model, max_batch=256, max_wait=0.002):
+    self.model = model
+    self.max_batch = max_batch
+    self.max_wait = max_wait
+    self.pending = queue.Queue()
+    self.worker = threading.Thread(target=self.run, daemon=True)
+    self.worker.start()
+
+  def submit(self, rows):
+    future = Future()
+    self.pending.put((rows, future))
+    return future
+
+  def run(self):
+    while True:
+      batch = [self.pending.get()]
+      size = len(batch[0][0])
+      deadline = time.perf_counter() + self.max_wait
+      while size < self.max_batch:
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+          break
+        try:
+          batch.append(self.pending.get(timeout=timeout))
+        except queue.Empty:
+          break
+        size += len(batch[-1][0])
+      self.score(batch)
+
+  def score(self, batch):
+    try:
+      proba = self.model.predict_proba(np.vstack([rows for rows, _ in batch]))[:, 1]
+    except Exception as error:
+      for _, future in batch:
+        future.set_exception(error)
+      return
+    start = 0
+    for rows, future in batch:
+      future.set_result(proba[start:start+len(rows)])
+      start += len(rows)
+
+
+class LatencyStats:
+  """Latencies of the last `window` requests, for p50/p99 and throughput."""
+
+  def __init__(self, window=10000):
+    self.latencies = collections.deque(maxlen=window)
+    self.lock = threading.Lock()
+    self.started = time.time()
+    self.requests = 0
+    self.rows = 0
+
+  def record(self, seconds, rows):
+    with self.lock:
+      self.latencies.append(seconds)
+      self.requests += 1
+      self.rows += rows
+
+  def summary(self):
+    with self.lock:
+      latencies = np.array(self.latencies)
+      elapsed = time.time() - self.started
+      summary = {'requests': self.requests, 'rows': self.rows,
+                 'requests_per_second': self.requests/elapsed, 'rows_per_second': self.rows/elapsed}
+    if len(latencies):
+      summary['p50_ms'], summary['p99_ms'] = np.percentile(latencies, [50, 99])*1000
+    return summary
+
+
+def payload_records(payload):
+  records = payload.get('records', payload) if isinstance(payload, dict) else payload
+  return [records] if isinstance(records, dict) else records
+
+
+def records_to_rows(payload, features):
+  """Feature matrix of a single record or a list of records, in the training column order."""
+  records = payload_records(payload)
+  missing = set(features).difference(*records) if records else set()
+  if missing or not records:
+    raise ValueError("Records must have every model feature, missing: %s" % sorted(missing))
+  rows = np.array([[record[name] for name in features] for record in records], dtype=np.float32)
+  if not np.isfinite(rows).all():            #would fail the whole micro-batch of the other requests
+    raise ValueError("Records must not have missing or infinite values")
+  return rows
+
+
+def add_windows(store, records):
+  """Adds raw windows to the store, returns the ids of the visits they belong to in order of arrival.
+
+  The windows before a rejected one (ValueError) stay in the store.
+  """
+  from preprocessing import ID_COLUMN
+  visits = []
+  for record in records:
+    store.add_window(record)
+    if record[ID_COLUMN] not in visits:
+      visits.append(record[ID_COLUMN])
+  return visits
+
+
+def visit_rows(store, visits, features):
+  """Imputed window 0-2 of the visits in the model feature order, and the mask of the scorable ones."""
+  rows = np.full((len(visits), len(features)), np.nan, dtype=np.float32)
+  for i, visit_id in enumerate(visits):
+    values = store.features(visit_id, features)
+    if values is not None:
+      rows[i] = values
+  return rows, np.isfinite(rows).all(axis=1)
+
+
+class ScoringHandler(BaseHTTPRequestHandler):
+  server_version = 'ICUScoring/1.0'
+
+  def send_json(self, status, body):
+    data = json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(data)))
+    self.end_headers()
+    self.wfile.write(data)
+
+  def do_GET(self):
+    if self.path == '/stats':
+      summary = self.server.stats.summary()
+      if self.server.store is not None:
+        with self.server.store_lock:
+          summary['visits'], summary['evicted_visits'] = len(self.server.store.visits), self.server.store.evicted
+      self.send_json(200, summary)
+    else:
+      self.send_json(404, {'error': 'not found'})
+
+  def do_POST(self):
+    if self.path not in ('/predict', '/windows', '/discharge') or (self.path != '/predict' and self.server.store is None):
+      self.send_json(404, {'error': 'not found'})
+      return
+    if self.path == '/discharge':
+      self.discharge()
+      return
+    start = time.perf_counter()
+    try:
+      payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+      if self.path == '/predict':
+        rows = records_to_rows(payload, self.server.features)
+      else:
+        with self.server.store_lock:
+          visits = add_windows(self.server.store, payload_records(payload))
+          rows, scorable = visit_rows(self.server.store, visits, self.server.features)
+          admitted = [bool(self.server.store.label(visit_id)) for visit_id in visits]
+    except (ValueError, TypeError, KeyError) as error:
+      self.send_json(400, {'error': str(error)})
+      return
+    if self.path == '/windows':
+      rows = rows[scorable]
+    try:
+      proba = self.server.batcher.submit(rows).result() if len(rows) else np.zeros(0)
+    except ValueError as error:
+      self.send_json(400, {'error': str(error)})
+      return
+    except Exception as error:
+      self.send_json(500, {'error': '%s: %s' % (type(error).__name__, error)})
+      return
+    self.server.stats.record(time.perf_counter()-start, len(rows))
+    if self.path == '/predict':
+      self.send_json(200, {'probabilities': proba.tolist()})
+      return
+    probabilities = np.full(len(visits), None, dtype=object)
+    probabilities[scorable] = proba.tolist()
+    self.send_json(200, {'visits': visits, 'probabilities': probabilities.tolist(), 'admitted': admitted})
+
+  def discharge(self):
+    try:
+      payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+      visits = payload['visits'] if isinstance(payload, dict) else payload
+      with self.server.store_lock:
+        discharged = [self.server.store.discharge(visit_id) for visit_id in visits]
+    except (ValueError, TypeError, KeyError) as error:
+      self.send_json(400, {'error': str(error)})
+      return
+    self.send_json(200, {'discharged': discharged})
+
+  def address_string(self):
+    return str(self.client_address[0]) if self.client_address else 'unix'
+
+  def log_message(self, format, *args):
+    pass                        #one line per request costs more than the scoring itself
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+  def server_bind(self):
+    socketserver.UnixStreamServer.server_bind(self)
+    self.server_name, self.server_port = 'localhost', 0
+
+
+def load_model(root, name, version=None, compiled=False):
+  """Fitted estimator of an artifact and its feature order.
+
+  With compiled=True a decision tree or random forest is served from its node
+  arrays (compiled_trees), with the same probabilities and without the per call
+  overhead of sklearn.
+  """
+  from artifacts import load_artifact          #joblib and the estimator modules are only needed once a model is loaded
+  model, manifest = load_artifact(root, name, version)
+  if not hasattr(model, 'predict_proba'):
+    raise ValueError("Model %s has no predict_proba and cannot be served as an ICU risk" % name)
+  if compiled:
+    from compiled_trees import compile_trees
+    model = compile_trees(model) or model
+  elif 'n_jobs' in model.get_params():
+    model.set_params(n_jobs=1)            #batches are small, starting threads on every call costs more than it saves
+  return model, manifest['features']
+
+
+def load_store(root, name, version, features, max_visits=MAX_VISITS):
+  """Empty feature store of the model features, hotcoded with the categories of its artifact."""
+  from artifacts import load_manifest
+  from feature_store import FeatureStore
+  return FeatureStore(features, load_manifest(root, name, version)['preprocessing']['categories'], max_visits)
+
+
+def make_server(model, features, host='127.0.0.1', port=8000, unix_socket=None, max_batch=256, max_wait=0.002, store=None):
+  if unix_socket:
+    if os.path.exists(unix_socket):
+      os.remove(unix_socket)
+    server = ThreadingUnixHTTPServer(unix_socket, ScoringHandler)
+  else:
+    server = ThreadingHTTPServer((host, port), ScoringHandler)
+  server.features = features
+  server.batcher = MicroBatcher(model, max_batch=max_batch, max_wait=max_wait)
+  server.stats = LatencyStats()
+  server.store = store
+  server.store_lock = threading.Lock()            #the store is shared by the handler threads
+  return server
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('root', help='artifact store written by the training script')
+  parser.add_argument('--name', default='random_forest', help='model to serve')
+  parser.add_argument('--version', help='artifact version, the latest one by default')
+  parser.add_argument('--compiled', action='store_true', help='serve a decision tree or random forest from its node arrays')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8000)
+  parser.add_argument('--unix-socket', help='serve on this Unix socket instead of TCP')
+  parser.add_argument('--max-batch', type=int, default=256, help='largest number of rows scored in one call')
+  parser.add_argument('--max-wait-ms', type=float, default=2.0, help='longest time a request waits for its batch to fill')
+  parser.add_argument('--max-visits', type=int, default=MAX_VISITS, help='visits kept by /windows, the least recently updated are evicted')
+  args = parser.parse_args(argv)
+  try:
+    model, features = load_model(args.root, args.name, args.version, args.compiled)
+  except ValueError as error:
+    parser.error(str(error))
+  store = load_store(args.root, args.name, args.version, features, args.max_visits)
+  server = make_server(model, features, args.host, args.port, args.unix_socket, args.max_batch, args.max_wait_ms/1000, store)
+  print("Serving", len(features), "features on", args.unix_socket or "%s:%d" % (args.host, args.port))
+  server.serve_forever()
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed on-disk cache of the pipeline stages.
+
+A stage is looked up by the hash of its name, the fingerprint of its code,
+its parameters and the keys of its inputs. The code fingerprint covers the
+stage function and the source files of the modules of this repository it
+imports, followed through their own imports, so an edit of e.g.
+preprocessing.py invalidates the stages that call into it. The key an output passes on to the
+stages downstream is the content hash of the output itself, the source file
+being keyed by its own content hash. So a stage recomputed with --force, or
+after its code changed, invalidates everything downstream as soon as its output
+differs, and nothing when the output is the same. Outputs are stored with their
+content key as
+
+    <root>/<stage>/<lookup key>.joblib
+
+and the least recently used ones are evicted once the cache is over its size
+budget. Stages named in `force` (exact names or patterns such as train-*) are
+recomputed even when cached.
+"""
+
+import ast
+import fnmatch
+import functools
+import hashlib
+import inspect
+import json
+import os
+import textwrap
+
+import joblib
+
+from profiling import stage
+
+
+class Cached:
+  """Output of a stage with its content key."""
+  __slots__ = ('key', 'value')
+
+  def __init__(self, key, value):
+    self.key = key
+    self.value = value
+
+
+CACHE_VERSION = 2                #bump when the stored format changes
+
+
+def imported_modules(source):
+  """Top-level names of the modules imported anywhere in `source`."""
+  names = set()
+  for node in ast.walk(ast.parse(source)):
+    if isinstance(node, ast.Import):
+      names.update(alias.name.split('.')[0] for alias in node.names)
+    elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+      names.add(node.module.split('.')[0])
+  return names
+
+
+@functools.lru_cache(maxsize=None)
+def module_sources(path):
+  """Hash and local imports of a source file, read once per process."""
+  with open(path, 'rb') as f:
+    source = f.read()
+  return hashlib.sha256(source).hexdigest(), imported_modules(source)
+
+
+def local_dependencies(names, root):
+  """Paths of the modules of `names` that are files in `root`, with every local module they import in turn."""
+  paths, pending = set(), list(names)
+  while pending:
+    path = os.path.join(root, pending.pop() + '.py')
+    if path in paths or not os.path.exists(path):
+      continue                    #installed packages are not followed
+    paths.add(path)
+    pending.extend(module_sources(path)[1])
+  return sorted(paths)
+
+
+def code_fingerprint(func, modules=()):
+  """Hash of the source of a stage function and of the local modules it imports, plus `modules`.
+
+  The qualified name stands in for the source when it is not available.
+  """
+  if func is None:
+    return None
+  try:
+    source = inspect.getsource(func)
+    root = os.path.dirname(os.path.abspath(inspect.getsourcefile(func)))
+    names = imported_modules(textwrap.dedent(source)) | set(modules)
+  except (OSError, TypeError, SyntaxError):
+    source = getattr(func, '__module__', '') + '.' + getattr(func, '__qualname__', repr(func))
+    root, names = os.getcwd(), set(modules)
+  digest = hashlib.sha256(source.encode())
+  for path in local_dependencies(names, root):
+    digest.update(module_sources(path)[0].encode())
+  return digest.hexdigest()[:16]
+
+
+def content_key(value):
+  """Hash of the content of a stage output, the key the stages downstream see."""
+  return joblib.hash(value)
+
+
+def stage_key(name, inputs, params, code=None):
+  payload = json.dumps([CACHE_VERSION, name, code, [i.key for i in inputs], params], sort_keys=True, default=repr)
+  return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class StageCache:
+  def __init__(self, root='stages.cache', max_bytes=2 << 30, force=(), enabled=True):
+    self.root = root
+    self.max_bytes = max_bytes
+    self.force = list(force)
+    self.enabled = enabled
+    self.hits = []
+    self.misses = []
+
+  def path(self, name, key):
+    return os.path.join(self.root, name, key + '.joblib')
+
+  def forced(self, name):
+    return any(pattern == 'all' or fnmatch.fnmatch(name, pattern) for pattern in self.force)
+
+  def lookup(self, name, inputs=(), params=None, func=None, modules=()):
+    """Cached output of the stage (with its content key) or None, and the key the output is stored under.
+
+    `modules` are local modules the stage depends on besides those `func` imports.
+    """
+    key = stage_key(name, inputs, params, code_fingerprint(func, modules))
+    path = self.path(name, key)
+    if not self.enabled or self.forced(name) or not os.path.exists(path):
+      return key, None
+    try:
+      output_key, value = joblib.load(path)
+    except Exception:           #a run killed while writing leaves a truncated file
+      return key, None
+    os.utime(path)              #the modification time is the LRU clock
+    self.hits.append(name)
+    return key, Cached(output_key, value)
+
+  def store(self, name, key, value):
+    self.misses.append(name)
+    output = Cached(content_key(value), value)
+    if self.enabled:
+      path = self.path(name, key)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      joblib.dump((output.key, value), path + '.tmp')
+      os.replace(path + '.tmp', path)
+      self.evict()
+    return output
+
+  def run(self, name, func, *inputs, **params):
+    """func(*input values, **params) unless the output for these inputs, params and code is cached."""
+    with stage(name) as event:
+      key, cached = self.lookup(name, inputs, params, func)
+      event.data['cached'] = cached is not None
+      if cached is None:
+        cached = self.store(name, key, func(*[i.value for i in inputs], **params))
+      event.output(cached.value)
+    return cached
+
+  def entries(self):
+    """(modification time, size, path) of every stored output."""
+    entries = []
+    for folder, _, files in os.walk(self.root):
+      for f in files:
+        if f.endswith('.joblib'):
+          stat = os.stat(os.path.join(folder, f))
+          entries.append((stat.st_mtime, stat.st_size, os.path.join(folder, f)))
+    return entries
+
+  def evict(self):
+    """Removes the least recently used outputs until the cache fits in max_bytes."""
+    entries = sorted(self.entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries[:-1]:        #the newest output is kept even when it alone is over budget
+      if total <= self.max_bytes:
+        break
+      os.remove(path)
+      total -= size
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Synthetic cohorts with the schema of the Sirio-Libanes sheet.
+
+Every patient has the 5 windows of the sheet (0-2, 2-4, 4-6, 6-12, ABOVE_12)
+and the same 231 columns in the same order:
+
+* demographics: AGE_ABOVE65, AGE_PERCENTIL ('10th' .. 'Above 90th'), GENDER;
+* comorbidities: DISEASE GROUPING 1-6, HTN, IMMUNOCOMPROMISED, OTHER, with a
+  few NaN values;
+* 36 lab tests as _MEDIAN/_MEAN/_MIN/_MAX/_DIFF. A lab panel is drawn in only
+  some windows, and when it is missing all 180 lab columns are NaN together.
+  One draw per window means MEDIAN = MEAN = MIN = MAX and DIFF = -1;
+* 6 vital signs as _MEAN/_MEDIAN/_MIN/_MAX/_DIFF/_DIFF_REL, missing more often
+  in the first window;
+* ICU: a patient is admitted from some window on and stays admitted, with
+  about half of the patients admitted at some point and a few already in the
+  ICU in window 0-2.
+
+Values are scaled to [-1, 1] like the sheet. A latent severity drives the ICU
+admission, the age and comorbidities, and shifts the labs and vitals, so
+correlation screening and the classifiers have signal to find. The real sheet
+has 385 patients.
+"""
+
+import numpy as np
+import pandas as pd
+
+WINDOWS = ['0-2', '2-4', '4-6', '6-12', 'ABOVE_12']
+AGE_PERCENTILES = ['10th', '20th', '30th', '40th', '50th', '60th', '70th', '80th', '90th', 'Above 90th']
+COMORBIDITIES = ['DISEASE GROUPING 1', 'DISEASE GROUPING 2', 'DISEASE GROUPING 3', 'DISEASE GROUPING 4',
+                 'DISEASE GROUPING 5', 'DISEASE GROUPING 6', 'HTN', 'IMMUNOCOMPROMISED', 'OTHER']
+COMORBIDITY_RATES = [0.09, 0.02, 0.09, 0.02, 0.12, 0.05, 0.2, 0.15, 0.8]
+LAB_TESTS = ['ALBUMIN', 'BE_ARTERIAL', 'BE_VENOUS', 'BIC_ARTERIAL', 'BIC_VENOUS', 'BILLIRUBIN', 'BLAST',
+             'CALCIUM', 'CREATININ', 'FFA', 'GGT', 'GLUCOSE', 'HEMATOCRITE', 'HEMOGLOBIN', 'INR', 'LACTATE',
+             'LEUKOCYTES', 'LINFOCITOS', 'NEUTROPHILES', 'P02_ARTERIAL', 'P02_VENOUS', 'PC02_ARTERIAL',
+             'PC02_VENOUS', 'PCR', 'PH_ARTERIAL', 'PH_VENOUS', 'PLATELETS', 'POTASSIUM', 'SAT02_ARTERIAL',
+             'SAT02_VENOUS', 'SODIUM', 'TGO', 'TGP', 'TTPA', 'UREA', 'DIMER']
+LAB_SUFFIXES = ['_MEDIAN', '_MEAN', '_MIN', '_MAX', '_DIFF']
+VITAL_SIGNS = ['BLOODPRESSURE_DIASTOLIC', 'BLOODPRESSURE_SISTOLIC', 'HEART_RATE', 'RESPIRATORY_RATE',
+               'TEMPERATURE', 'OXYGEN_SATURATION']
+VITAL_SUFFIXES = ['_MEAN', '_MEDIAN', '_MIN', '_MAX', '_DIFF', '_DIFF_REL']
+LAB_PANEL_RATE = [0.5, 0.3, 0.3, 0.35, 0.6]           #probability of a blood draw in every window
+VITALS_RATE = [0.55, 0.85, 0.85, 0.9, 0.95]
+ICU_ONSET = [0.12, 0.22, 0.2, 0.22, 0.24]              #window of the admission of the patients admitted
+
+
+def columns():
+  """Column names of the sheet, in its order."""
+  labs = [test + suffix for test in LAB_TESTS for suffix in LAB_SUFFIXES]
+  vitals = [sign + suffix for sign in VITAL_SIGNS for suffix in VITAL_SUFFIXES]
+  return (['PATIENT_VISIT_IDENTIFIER', 'AGE_ABOVE65', 'AGE_PERCENTIL', 'GENDER'] + COMORBIDITIES
+          + labs + vitals + ['WINDOW', 'ICU'])
+
+
+def sigmoid(x):
+  return 1/(1+np.exp(-x))
+
+
+def measurements(rng, severity, effects, spread):
+  """(windows x patients x measures) values in [-1, 1] shifted by the (windows x patients) severity."""
+  base = rng.normal(0, 0.25, size=(1, severity.shape[1], effects.size))
+  noise = rng.normal(0, spread, size=severity.shape + (effects.size,))
+  return np.clip(base + noise + 0.15*severity[:, :, None]*effects, -1, 1)
+
+
+def make_cohort(n_patients=385, random_state=0):
+  """Synthetic sheet of `n_patients` patients x 5 windows, ordered like the Kaggle sheet."""
+  rng = np.random.default_rng(random_state)
+  n, w = n_patients, len(WINDOWS)
+
+  age = rng.integers(0, len(AGE_PERCENTILES), size=n)
+  age_above65 = (age >= 6).astype(np.int64)
+  severity = rng.normal(0, 1, size=n) + 0.6*age_above65
+  comorbid = rng.random((n, len(COMORBIDITIES))) < np.array(COMORBIDITY_RATES)*np.exp(0.4*severity[:, None])
+  severity = severity + 0.3*comorbid[:, :8].sum(axis=1)
+
+  admitted = rng.random(n) < sigmoid(1.2*severity - 0.6)
+  onset = np.where(admitted, rng.choice(w, size=n, p=ICU_ONSET), w)
+  icu = np.arange(w)[:, None] >= onset[None, :]          #windows x patients, admitted from the onset window on
+
+  lab_effects = rng.normal(0, 1, size=len(LAB_TESTS))
+  labs = measurements(rng, severity[None, :] + icu, lab_effects, 0.1)
+  labs[~(rng.random((w, n)) < np.array(LAB_PANEL_RATE)[:, None])] = np.nan
+  lab_columns = np.repeat(labs, len(LAB_SUFFIXES), axis=2)
+  lab_columns[:, :, len(LAB_SUFFIXES)-1::len(LAB_SUFFIXES)] = np.where(np.isnan(labs), np.nan, -1.0)    #_DIFF of a single draw
+
+  vital_effects = rng.normal(0, 1, size=len(VITAL_SIGNS))
+  vitals = measurements(rng, severity[None, :] + icu, vital_effects, 0.15)
+  width = np.abs(rng.normal(0, 0.1, size=vitals.shape))
+  diff = np.clip(-1 + 4*width, -1, 1)
+  vital_columns = np.stack([vitals, vitals, np.clip(vitals-width, -1, 1), np.clip(vitals+width, -1, 1), diff, diff], axis=3)
+  vital_columns[~(rng.random((w, n)) < np.array(VITALS_RATE)[:, None])] = np.nan
+  vital_columns = vital_columns.reshape(w, n, -1)
+
+  #rows patient by patient, window by window, like the sheet
+  rows = n*w
+  data = {
+    'PATIENT_VISIT_IDENTIFIER': np.repeat(np.arange(n), w),
+    'AGE_ABOVE65': np.repeat(age_above65, w),
+    'AGE_PERCENTIL': np.repeat(np.array(AGE_PERCENTILES, dtype=object)[age], w),
+    'GENDER': np.repeat(rng.integers(0, 2, size=n), w),
+  }
+  comorbid = np.repeat(comorbid.astype(np.float64), w, axis=0)
+  comorbid[rng.random(comorbid.shape) < 0.002] = np.nan
+  data.update(zip(COMORBIDITIES, comorbid.T))
+  measured = np.concatenate([lab_columns, vital_columns], axis=2).transpose(1, 0, 2).reshape(rows, -1)
+  names = columns()
+  data.update(zip(names[4+len(COMORBIDITIES):-2], measured.T))
+  data['WINDOW'] = np.tile(np.array(WINDOWS, dtype=object), n)
+  data['ICU'] = icu.T.reshape(-1).astype(np.int64)
+  return pd.DataFrame(data, columns=names)
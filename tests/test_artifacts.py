@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+from sklearn.tree import DecisionTreeClassifier
+
+from artifacts import MODEL_FILE, list_versions, load_artifact, save_artifact
+
+
+def test_saved_version_is_written_once(tmp_path):
+  rng = np.random.RandomState(0)
+  X = rng.normal(size=(50, 3))
+  y = (X[:, 0] > 0).astype(int)
+  model = DecisionTreeClassifier(max_depth=2, random_state=0).fit(X, y)
+  root = str(tmp_path)
+  version = save_artifact(root, 'tree', model, ['a', 'b', 'c'], {}, X, y)
+  path = os.path.join(root, 'tree', version, MODEL_FILE)
+  loaded, manifest = load_artifact(root, 'tree')
+  stat = os.stat(path)
+  assert save_artifact(root, 'tree', model, ['a', 'b', 'c'], {}, X, y) == version
+  assert os.stat(path).st_ino == stat.st_ino and os.stat(path).st_mtime_ns == stat.st_mtime_ns
+  assert list_versions(root, 'tree') == [version] and sorted(os.listdir(os.path.join(root, 'tree'))) == sorted(['LATEST', version])
+  np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
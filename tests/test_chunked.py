@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import pytest
+
+import chunked
+import synthetic
+from covid19_icu_prediction import load_data, preprocess
+from feature_selection import select_features, target_correlations
+from preprocessing import compact_dtypes
+
+
+@pytest.fixture(scope='module')
+def source(tmp_path_factory):
+  data = synthetic.make_cohort(150, random_state=2)
+  path = tmp_path_factory.mktemp('chunked') / 'extract.csv'
+  data.to_csv(path, index=False)
+  return str(path), data
+
+
+@pytest.mark.parametrize('chunk_rows', [7, 64, 100000])
+def test_chunked_rows_are_the_in_memory_rows(source, chunk_rows, tmp_path):
+  path, data = source
+  expected = preprocess(compact_dtypes(pd.read_csv(path)))
+  chunked.preprocess_source(path, str(tmp_path / 'out'), chunk_rows=chunk_rows)
+  result = chunked.read_columns(str(tmp_path / 'out'), mmap=False)
+  assert list(result.columns) == list(expected.columns)
+  np.testing.assert_array_equal(result.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
+  assert chunked.select_from_folder(str(tmp_path / 'out')) == select_features(expected)
+  np.testing.assert_allclose(chunked.feature_moments(str(tmp_path / 'out')).correlations(), target_correlations(expected), atol=1e-12)
+
+
+def test_empty_source(source, tmp_path):
+  path, data = source
+  data.iloc[:0].to_csv(tmp_path / 'empty.csv', index=False)
+  with pytest.raises(ValueError):
+    chunked.preprocess_source(str(tmp_path / 'empty.csv'), str(tmp_path / 'out'))
+
+
+def test_streamed_workbook_rows_are_the_in_memory_rows(source, tmp_path):
+  path, data = source
+  workbook = str(tmp_path / 'extract.xlsx')
+  data.to_excel(workbook, index=False)
+  expected = preprocess(load_data(workbook))
+  chunked.preprocess_source(workbook, str(tmp_path / 'out'), chunk_rows=64)
+  result = chunked.read_columns(str(tmp_path / 'out'), mmap=False)
+  assert list(result.columns) == list(expected.columns)
+  np.testing.assert_array_equal(result.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
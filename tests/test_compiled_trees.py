@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from compiled_trees import CompiledTrees, compile_trees
+
+
+@pytest.fixture(scope='module')
+def data():
+  rng = np.random.RandomState(1)
+  X = rng.normal(size=(400, 8)).astype(np.float32)
+  y = (X[:, 0] - X[:, 3] + rng.normal(scale=0.5, size=400) > 0).astype(int)
+  return X, y
+
+
+@pytest.mark.parametrize('model', [DecisionTreeClassifier(max_depth=6, random_state=0),
+                                   RandomForestClassifier(n_estimators=30, max_depth=8, random_state=23)])
+def test_probabilities_are_sklearn_ones(data, model, tmp_path):
+  X, y = data
+  model.fit(X[:300], y[:300])
+  compiled = compile_trees(model)
+  compiled.block_rows = 37                      #several blocks
+  np.testing.assert_array_equal(compiled.predict_proba(X[300:]), model.predict_proba(X[300:]))
+  np.testing.assert_array_equal(compiled.predict(X[300:]), model.predict(X[300:]))
+  compiled.save(tmp_path / 'trees.npz')
+  np.testing.assert_array_equal(CompiledTrees.load(tmp_path / 'trees.npz').predict_proba(X[300:]), model.predict_proba(X[300:]))
+
+
+def test_other_models_are_not_compiled(data):
+  X, y = data
+  assert compile_trees(LogisticRegression().fit(X, y)) is None
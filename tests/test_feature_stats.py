@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import synthetic
+from covid19_icu_prediction import preprocess
+from feature_selection import select_features, target_correlations
+from feature_stats import FeatureMoments, MomentStore, merge_all, reselect
+from preprocessing import LABEL_COLUMN
+
+
+@pytest.fixture(scope='module')
+def final_data():
+  return preprocess(synthetic.make_cohort(200, random_state=4))
+
+
+def assert_same_moments(moments, frame):
+  features = [name for name in frame.columns if name != LABEL_COLUMN]
+  x = frame[features].to_numpy(dtype=np.float64)
+  assert moments.n == len(frame)
+  np.testing.assert_allclose(moments.mean, x.mean(axis=0), atol=1e-12)
+  np.testing.assert_allclose(moments.variance(), x.var(axis=0, ddof=1), atol=1e-10)
+  np.testing.assert_allclose(moments.correlations(), target_correlations(frame), atol=1e-10)
+  for label, column in ((0, 'non_icu'), (1, 'icu')):
+    np.testing.assert_allclose(moments.class_means()[column], x[frame[LABEL_COLUMN] == label].mean(axis=0), atol=1e-12)
+
+
+def test_updates_and_merges_pool_the_patients(final_data):
+  features = [name for name in final_data.columns if name != LABEL_COLUMN]
+  updated = FeatureMoments(features)
+  for start in range(0, len(final_data), 37):
+    updated.update(final_data.iloc[start:start+37])
+  assert_same_moments(updated, final_data)
+  shards = [FeatureMoments.from_frame(final_data.iloc[i::3]) for i in range(3)]
+  merged = merge_all(shards)
+  assert_same_moments(merged, final_data)
+  assert reselect(merged) == select_features(final_data)
+
+
+def test_store_skips_other_features(final_data, tmp_path):
+  store = MomentStore(str(tmp_path))
+  store.save('a', FeatureMoments.from_frame(final_data.iloc[:100]))
+  store.save('b', FeatureMoments.from_frame(final_data.iloc[100:]))
+  store.save('c', FeatureMoments.from_frame(final_data.iloc[:, 1:]))
+  with pytest.warns(UserWarning, match='c'):
+    merged = store.merged()
+  assert_same_moments(merged, final_data)
+  assert store.merged(exclude=['a', 'b']).features == list(final_data.columns[1:-1])
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import urllib.request
+
+import numpy as np
+import pytest
+
+import synthetic
+from feature_store import FeatureStore
+from preprocessing import (ID_COLUMN, LABEL_COLUMN, dummy_categories, impute_first_window, one_hot_encode,
+                           propagate_icu_labels)
+from scoring_server import make_server
+
+
+def raw_records(data):
+  """Raw windows as JSON would bring them, NaN as missing keys."""
+  return [dict((k, v) for k, v in record.items() if not (isinstance(v, float) and np.isnan(v)))
+          for record in data.to_dict('records')]
+
+
+@pytest.fixture(scope='module')
+def cohort():
+  data = synthetic.make_cohort(40, random_state=3)
+  expected = impute_first_window(propagate_icu_labels(one_hot_encode(data))).reset_index(drop=True)
+  columns = [name for name in expected.columns if name not in (ID_COLUMN, LABEL_COLUMN)]
+  return data, expected, columns, dummy_categories(data)
+
+
+def test_store_matches_batch_preprocessing(cohort):
+  data, expected, columns, categories = cohort
+  store = FeatureStore(columns, categories)
+  for record in raw_records(data):
+    store.add_window(record)
+  frame = store.frame()
+  assert frame[ID_COLUMN].tolist() == expected[ID_COLUMN].tolist()
+  assert frame[LABEL_COLUMN].tolist() == expected[LABEL_COLUMN].astype(int).tolist()
+  np.testing.assert_allclose(frame[columns].to_numpy(dtype=np.float64), expected[columns].to_numpy(dtype=np.float64), rtol=1e-6)
+
+
+def test_out_of_order_window_is_rejected(cohort):
+  data, _, columns, categories = cohort
+  records = raw_records(data[data[ID_COLUMN] == data[ID_COLUMN].iloc[-1]])
+  store = FeatureStore(columns, categories)
+  store.add_window(records[1])
+  before = store.features(records[1][ID_COLUMN]).copy()
+  for late in (records[0], records[1]):
+    with pytest.raises(ValueError):
+      store.add_window(late)
+  np.testing.assert_array_equal(store.features(records[1][ID_COLUMN]), before)
+  with pytest.raises(ValueError):
+    store.add_window(dict(records[2], WINDOW=None))
+
+
+def test_bad_value_leaves_the_visit_unchanged(cohort):
+  data, _, columns, categories = cohort
+  record = raw_records(data[data[ID_COLUMN] == data[ID_COLUMN].iloc[0]])[0]
+  store = FeatureStore(columns, categories)
+  with pytest.raises(ValueError):
+    store.add_window(dict(record, HTN='x'))
+  assert record[ID_COLUMN] not in store.visits
+  store.add_window(record)
+  assert store.features(record[ID_COLUMN]) is not None
+
+
+def test_least_recently_updated_visits_are_evicted(cohort):
+  data, _, columns, categories = cohort
+  store = FeatureStore(columns, categories, max_visits=2)
+  visits = data[ID_COLUMN].unique()[:3]
+  first = dict((visit_id, raw_records(data[data[ID_COLUMN] == visit_id])) for visit_id in visits)
+  store.add_window(first[visits[0]][0])
+  store.add_window(first[visits[1]][0])
+  store.add_window(first[visits[0]][1])          #visit 0 is now the most recent
+  store.add_window(first[visits[2]][0])
+  assert list(store.visits) == [visits[0], visits[2]] and store.evicted == 1
+  assert store.discharge(visits[0]) and not store.discharge(visits[0])
+  assert list(store.visits) == [visits[2]]
+
+
+class Mean:
+  """Stands in for a model: the ICU probability is the mean of the features, clipped to [0, 1]."""
+
+  def predict_proba(self, X):
+    p = np.clip(np.asarray(X).mean(axis=1), 0, 1)
+    return np.column_stack([1-p, p])
+
+
+def post(server, path, body):
+  request = urllib.request.Request('http://127.0.0.1:%d%s' % (server.server_port, path), data=json.dumps(body).encode())
+  try:
+    with urllib.request.urlopen(request) as response:
+      return response.status, json.loads(response.read())
+  except urllib.error.HTTPError as error:
+    return error.code, json.loads(error.read())
+
+
+def test_windows_endpoint_scores_visits_as_windows_arrive(cohort):
+  data, expected, columns, categories = cohort
+  features = ['AGE_ABOVE65', 'HTN', 'HEART_RATE_MEAN']
+  server = make_server(Mean(), features, port=0, store=FeatureStore(features, categories))
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  try:
+    records = raw_records(data)
+    latest = {}
+    for record in records:
+      status, body = post(server, '/windows', {'records': [record]})
+      assert status == 200 and body['visits'] == [record[ID_COLUMN]]
+      latest[record[ID_COLUMN]] = body['probabilities'][0]
+    status, body = post(server, '/windows', {'records': records[:1]})
+    assert status == 400
+    status, body = post(server, '/windows', {'records': [dict(records[-1], WINDOW='0-2', **{ID_COLUMN: -1})]})
+    assert status == 200 and body['admitted'] == [bool(records[-1][LABEL_COLUMN])]
+    status, body = post(server, '/discharge', {'visits': [-1, -2]})
+    assert status == 200 and body['discharged'] == [True, False]
+  finally:
+    server.shutdown()
+    server.server_close()
+
+  rows = expected.set_index(ID_COLUMN)[features]
+  for visit_id, row in rows.iterrows():
+    values = row.to_numpy(dtype=np.float64)
+    np.testing.assert_allclose(server.store.features(visit_id, features), values, rtol=1e-6)
+    if np.isfinite(values).all():
+      assert latest[visit_id] == pytest.approx(Mean().predict_proba(values[None, :].astype(np.float32))[0, 1])
+    else:
+      assert latest[visit_id] is None
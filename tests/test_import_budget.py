@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+from benchmarks import IMPORT_BUDGETS, check_import_budgets
+
+
+def test_imports_stay_within_budget():
+  table = check_import_budgets(IMPORT_BUDGETS, repeats=3)
+  assert table['ok'].all(), table
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import warnings
+
+import numpy as np
+import pytest
+from sklearn import metrics as sk
+
+from metrics import evaluate, roc_auc
+
+
+@pytest.fixture(scope='module')
+def outputs():
+  rng = np.random.RandomState(3)
+  y = rng.randint(0, 2, 300)
+  proba = np.clip(y*0.3 + rng.uniform(size=(4, 300))*0.7, 0, 1).round(2)     #rounded for ties
+  return y, proba
+
+
+def test_evaluate_matches_sklearn(outputs):
+  y, proba = outputs
+  predictions = (proba >= 0.5).astype(int)
+  table = evaluate(y, predictions, proba)
+  for i in range(len(proba)):
+    tn, fp, fn, tp = sk.confusion_matrix(y, predictions[i]).ravel()
+    assert (table['tn'][i], table['fp'][i], table['fn'][i], table['tp'][i]) == (tn, fp, fn, tp)
+    assert table['accuracy'][i] == pytest.approx(sk.accuracy_score(y, predictions[i]))
+    assert table['sensitivity'][i] == pytest.approx(sk.recall_score(y, predictions[i]))
+    assert table['roc_auc'][i] == pytest.approx(sk.roc_auc_score(y, proba[i]))
+    assert table['log_loss'][i] == pytest.approx(sk.log_loss(y, proba[i]))
+
+
+def test_missing_rankings_fall_back(outputs):
+  y, proba = outputs
+  predictions = (proba >= 0.5).astype(int)
+  stacked = proba.copy()
+  stacked[1] = np.nan
+  table = evaluate(y, predictions, stacked)
+  assert table['roc_auc'][0] == pytest.approx(sk.roc_auc_score(y, proba[0]))
+  assert table['roc_auc'][1] == pytest.approx(sk.roc_auc_score(y, predictions[1]))
+
+
+def test_single_class_is_nan():
+  with warnings.catch_warnings():
+    warnings.simplefilter('error')
+    assert np.isnan(roc_auc(np.ones(10), np.linspace(0, 1, 10))).all()
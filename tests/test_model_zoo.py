@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.naive_bayes import GaussianNB
+
+from artifacts import artifact_version
+from model_zoo import run_zoo, thread_budget
+
+
+def test_forest_jobs_fit_within_the_worker_threads():
+  assert thread_budget(RandomForestClassifier(n_jobs=-1), 1) == (1, 1)
+  assert thread_budget(RandomForestClassifier(n_jobs=4), 2) == (2, 1)
+  assert thread_budget(RandomForestClassifier(n_jobs=2), 8) == (2, 4)
+  assert thread_budget(GaussianNB(), 4) == (None, 4)
+
+
+def test_forest_jobs_change_neither_model_nor_version():
+  rng = np.random.RandomState(0)
+  X = rng.normal(size=(200, 5))
+  y = (X[:, 0] > 0).astype(int)
+  models = dict(('rf-%d' % jobs, RandomForestClassifier(n_estimators=20, random_state=23, n_jobs=jobs)) for jobs in (1, -1))
+  table, fitted = run_zoo(models, X[:150], y[:150], X[150:], y[150:], n_workers=1)
+  assert fitted['rf--1'].get_params()['n_jobs'] == -1
+  np.testing.assert_array_equal(fitted['rf-1'].predict_proba(X), fitted['rf--1'].predict_proba(X))
+  assert artifact_version(fitted['rf-1'], X, y) == artifact_version(fitted['rf--1'], X, y)
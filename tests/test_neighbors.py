@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from sklearn.model_selection import GridSearchCV
+from sklearn.neighbors import KNeighborsClassifier
+
+from neighbors import KNNSearch, NeighborIndex
+
+
+@pytest.fixture(scope='module')
+def data():
+  rng = np.random.RandomState(0)
+  X = rng.normal(size=(240, 6)).astype(np.float32)
+  y = (X[:, 0] + X[:, 1]*X[:, 2] + rng.normal(scale=0.8, size=240) > 0).astype(int)
+  return X, y
+
+
+def test_knn_search_matches_grid_search(data):
+  X, y = data
+  grid = {'n_neighbors': [5, 10, 15, 20], 'p': [1, 2]}
+  search = KNNSearch(cv=5, **grid).fit(X, y)
+  reference = GridSearchCV(KNeighborsClassifier(), grid, cv=5).fit(X, y)
+  assert search.cv_results_['params'] == list(reference.cv_results_['params'])
+  np.testing.assert_allclose(search.cv_results_['mean_test_score'], reference.cv_results_['mean_test_score'])
+  assert search.best_params_ == reference.best_params_
+  np.testing.assert_array_equal(search.predict(X), reference.predict(X))
+
+
+def test_neighbor_index_matches_kneighbors(data):
+  X, y = data
+  index = NeighborIndex(n_neighbors=7, max_k=20, p=2).fit(X[:180], y[:180])
+  for k in (1, 7, 20):
+    reference = KNeighborsClassifier(n_neighbors=k).fit(X[:180], y[:180])
+    np.testing.assert_array_equal(index.predict(X[180:], k), reference.predict(X[180:]))
+    np.testing.assert_allclose(index.predict_proba(X[180:], k), reference.predict_proba(X[180:]))
+
+
+@pytest.mark.parametrize('k', [0, -1, 21])
+def test_k_out_of_range(data, k):
+  X, y = data
+  index = NeighborIndex(n_neighbors=7, max_k=20).fit(X, y)
+  with pytest.raises(ValueError):
+    index.predict(X, k)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""The vectorized pre-processing against the loops of the original notebook."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from preprocessing import ID_COLUMN, LABEL_COLUMN, impute_first_window, one_hot_encode, propagate_icu_labels
+
+
+def legacy_propagate(data_expand):
+  """Label propagation and ICU window removal of the notebook, five windows per visit."""
+  column_names = data_expand.columns
+  arr = data_expand.to_numpy(dtype=object)
+  i = 0
+  ICU_admitted_rows = []
+  while i < len(arr):
+    for j in range(5):
+      if arr[i+j][-1] == 1:
+        for k in range(j):
+          arr[i+k][-1] = 1
+        for toremove in range(i+j, i+5):
+          ICU_admitted_rows.append(toremove)
+        break
+    i += 5
+  arr = np.delete(arr, ICU_admitted_rows, axis=0)
+  return pd.DataFrame(arr, columns=column_names).infer_objects()
+
+
+def legacy_impute(df):
+  """fillna loop of the notebook, over every visit (the notebook stopped before the last id)."""
+  edited_dfs_list = []
+  for i in df[ID_COLUMN].unique():
+    tempdf = df[df[ID_COLUMN] == i].astype(np.float64)
+    tempdf = tempdf.fillna(tempdf.mean())
+    edited_dfs_list.append(tempdf.iloc[[0]])
+  return pd.concat(edited_dfs_list)
+
+
+@pytest.fixture(scope='module')
+def data_expand():
+  return one_hot_encode(synthetic.make_cohort(60, random_state=5))
+
+
+def test_propagation_matches_legacy_loop(data_expand):
+  expected = legacy_propagate(data_expand)
+  result = propagate_icu_labels(data_expand)
+  assert result[ID_COLUMN].tolist() == expected[ID_COLUMN].tolist()
+  assert result[LABEL_COLUMN].tolist() == expected[LABEL_COLUMN].tolist()
+  np.testing.assert_array_equal(result.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64))
+
+
+def test_imputation_matches_legacy_loop(data_expand):
+  df = propagate_icu_labels(data_expand)
+  expected = legacy_impute(df)
+  result = impute_first_window(df)
+  assert result.index.tolist() == expected.index.tolist()
+  np.testing.assert_allclose(result.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64), rtol=1e-12)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from stage_cache import StageCache, module_sources
+
+SOURCE = {'rows': [1, 2, 3]}
+
+
+def load():
+  return list(SOURCE['rows'])
+
+
+def total(rows, scale=1):
+  return sum(rows)*scale
+
+
+def pipeline(cache):
+  rows = cache.run('load', load)
+  return cache.run('total', total, rows, scale=2).value
+
+
+def test_unchanged_output_keeps_downstream_hits(tmp_path):
+  assert pipeline(StageCache(str(tmp_path))) == 12
+  cache = StageCache(str(tmp_path), force=['load'])
+  assert pipeline(cache) == 12
+  assert cache.misses == ['load'] and cache.hits == ['total']
+
+
+def test_changed_output_cascades(tmp_path):
+  assert pipeline(StageCache(str(tmp_path))) == 12
+  SOURCE['rows'] = [1, 2, 3, 4]
+  try:
+    cache = StageCache(str(tmp_path), force=['load'])
+    assert pipeline(cache) == 20
+    assert cache.misses == ['load', 'total']
+  finally:
+    SOURCE['rows'] = [1, 2, 3]
+
+
+def test_params_are_part_of_the_key(tmp_path):
+  cache = StageCache(str(tmp_path))
+  rows = cache.run('load', load)
+  assert cache.run('total', total, rows, scale=2).value == 12
+  assert cache.run('total', total, rows, scale=3).value == 18
+  assert cache.misses == ['load', 'total', 'total']
+
+
+def test_edited_dependency_invalidates(tmp_path, monkeypatch):
+  (tmp_path / 'stage_lib.py').write_text("def double(rows):\n  return [2*r for r in rows]\n")
+  (tmp_path / 'stage_defs.py').write_text("def doubled():\n  from stage_lib import double\n  return double([1, 2])\n")
+  monkeypatch.syspath_prepend(str(tmp_path))
+  import stage_defs
+  cache = StageCache(str(tmp_path / 'cache'))
+  assert cache.run('doubled', stage_defs.doubled).value == [2, 4]
+  assert cache.run('doubled', stage_defs.doubled).value == [2, 4]
+  assert cache.hits == ['doubled']
+  (tmp_path / 'stage_lib.py').write_text("def double(rows):\n  return [r + r for r in rows]\n")
+  module_sources.cache_clear()         #a new run reads the files again
+  cache.run('doubled', stage_defs.doubled)
+  assert cache.misses == ['doubled', 'doubled']